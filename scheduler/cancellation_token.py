@@ -0,0 +1,18 @@
+import multiprocessing
+
+
+class CancellationToken:
+    """
+    Asks a running schedule search to stop and return the best schedule found so far.
+    It can be cancelled from another thread, and is seen by the search's worker processes.
+    """
+
+    def __init__(self):
+        self._event = multiprocessing.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
@@ -0,0 +1,109 @@
+import math
+from typing import List
+
+import numpy as np
+
+
+class LineupIndex:
+    """
+    Inverted index from players to the lineups they play in.
+
+    Each player has a bitset with bit l set when they're on the field in lineup l,
+    plus its complement for when they're sitting.  Lineups are sorted strongest first,
+    so lineups at least some strength are a prefix of every bitset.  Finding lineups that
+    include or exclude a set of players is then an AND of a few bitset prefixes,
+    64 lineups at a time, instead of a scan over every lineup.
+
+    For fairness checks that can't be written as include/exclude masks there is also
+    the lineups x players incidence matrix, checked against a whole count vector at once.
+    It's stored players x lineups so the per lineup max and min run along contiguous rows.
+    """
+
+    def __init__(self, masks: List[int], strengths: List[float], num_players: int):
+        """
+        Args:
+            masks: Bitmask of the players in each lineup.
+            strengths: Strength of each lineup, strongest first.
+            num_players: Number of bits used by the masks.
+        """
+        masks = np.asarray(masks, dtype=np.uint64)
+        num_lineups = len(masks)
+
+        # Pad the lineups to a whole number of 64 bit words
+        num_words = (num_lineups + 63) // 64
+        playing = np.zeros((num_players, num_words * 64), dtype=bool)
+        for i in range(num_players):
+            playing[i, :num_lineups] = (masks >> np.uint64(i)) & np.uint64(1)
+
+        sitting = ~playing
+        sitting[:, num_lineups:] = False
+
+        self.incidence = playing[:, :num_lineups].astype(np.int8)
+        self.playing = np.packbits(playing, axis=1, bitorder="little").view(np.uint64)
+        self.sitting = np.packbits(sitting, axis=1, bitorder="little").view(np.uint64)
+        self.num_lineups = num_lineups
+        self.neg_strengths = -np.asarray(strengths, dtype=np.float64)
+
+    def count_at_least(self, minimum: float) -> int:
+        """
+        Number of lineups with strength >= minimum.  They are the first lineups.
+        """
+        return int(np.searchsorted(self.neg_strengths, -minimum, side="right"))
+
+    def all(self, count: int) -> np.ndarray:
+        """
+        Bitset of the first count lineups.
+        """
+        bitset = np.full((count + 63) // 64, ~np.uint64(0), dtype=np.uint64)
+        return self._truncate(bitset, count)
+
+    def including(self, players: int, count: int) -> np.ndarray:
+        """
+        Bitset of the first count lineups with every player in the players mask on the field.
+        """
+        return self._intersect(self.playing, players, count)
+
+    def excluding(self, players: int, count: int) -> np.ndarray:
+        """
+        Bitset of the first count lineups with every player in the players mask sitting.
+        """
+        return self._intersect(self.sitting, players, count)
+
+    def lineups(self, bitset: np.ndarray) -> np.ndarray:
+        """
+        Indexes of the lineups in a bitset, strongest first.
+        """
+        return np.flatnonzero(np.unpackbits(bitset.view(np.uint8), bitorder="little"))
+
+    def find(self, include: int, exclude: int, minimum: float) -> np.ndarray:
+        """
+        Indexes of the lineups at least minimum strong that include every player in
+        the include mask and exclude every player in the exclude mask, strongest first.
+        """
+        count = self.count_at_least(minimum)
+        return self.lineups(self.including(include, count) & self.excluding(exclude, count))
+
+    def is_fair(self, counts: np.ndarray, fairness: int, minimum: float = -math.inf) -> np.ndarray:
+        """
+        For each lineup at least minimum strong, whether the counts stay within fairness
+        of each other after everyone on the field plays another inning.
+
+        counts can also be a (count vectors, players) array, giving a (count vectors, lineups) result.
+        """
+        count = self.count_at_least(minimum)
+        after = self.incidence[:, :count] + np.asarray(counts, dtype=np.int8)[..., None]
+        return after.max(axis=-2) - after.min(axis=-2) <= fairness
+
+    def _intersect(self, bitsets: np.ndarray, players: int, count: int) -> np.ndarray:
+        bitset = self.all(count)
+        while players:
+            bit = players & -players
+            bitset &= bitsets[bit.bit_length() - 1, :len(bitset)]
+            players ^= bit
+        return bitset
+
+    def _truncate(self, bitset: np.ndarray, count: int) -> np.ndarray:
+        # Clear the bits past count in the last word
+        if count % 64:
+            bitset[-1] &= np.uint64((1 << (count % 64)) - 1)
+        return bitset
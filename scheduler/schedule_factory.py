@@ -1,6 +1,7 @@
 from enum import Enum
-from typing import Callable, List
+from typing import Callable, List, Optional
 
+from scheduler.cancellation_token import CancellationToken
 from scheduler.progress_callback import ProgressCallback
 from scheduler.validation import validate
 from scheduler_beam.beam_schedule import BeamScheduler
@@ -15,14 +16,20 @@ from softball_models.schedule_config import ScheduleConfig, SchedulerType
 class ScheduleFactory:
 
     @staticmethod
-    def create(players: List[Player], schedule_config: ScheduleConfig, progress_callback: ProgressCallback) -> Schedule:
+    def create(players: List[Player], schedule_config: ScheduleConfig, progress_callback: ProgressCallback,
+               deadline: Optional[float] = None, cancellation_token: Optional[CancellationToken] = None) -> Schedule:
+        """
+        Args:
+            deadline: time.time() by which the beam search stops and returns the best schedule found so far.
+            cancellation_token: Stops the beam search early the same way.
+        """
 
         
         def create_greedy():
             return GreedyScheduler.create(players, schedule_config)
 
         def create_beam():
-            return BeamScheduler.create(players, schedule_config, progress_callback)
+            return BeamScheduler.create(players, schedule_config, progress_callback, deadline, cancellation_token)
         
         def create_dp():
             return DPScheduler.create(players, schedule_config)
@@ -36,6 +43,8 @@ class ScheduleFactory:
         schedule = dispatcher[schedule_config.schedule_type]()
 
         validate(schedule)
+        for alternative in schedule.alternatives:
+            validate(alternative)
 
         return schedule
 
@@ -1,16 +1,21 @@
 
 
+from typing import Optional
+
 from scheduler.progress_callback import ProgressCallback
 from utils.rolling_window import RollingWindow
 
 
 class BeamEtaPredictor:
 
-    def __init__(self, progress_callback: ProgressCallback, num_percentiles: int, num_innings: int):
+    def __init__(self, progress_callback: ProgressCallback, num_percentiles: int, num_innings: int,
+                 total_leafs: Optional[int] = None):
         self.progress_callback = progress_callback
         self.num_innings = num_innings
         self.num_percentiles = num_percentiles
-        self.total_leafs = num_percentiles ** num_innings
+
+        # Searches that aren't a tree of percentiles give their own total
+        self.total_leafs = total_leafs if total_leafs is not None else num_percentiles ** num_innings
 
         self.nodes_eliminated = RollingWindow(3)
 
@@ -18,8 +23,9 @@ class BeamEtaPredictor:
         
 
     def report(self, depth):
-        completed = self.num_percentiles ** (self.num_innings - depth + 1) 
+        self.report_leafs(self.num_percentiles ** (self.num_innings - depth + 1))
 
+    def report_leafs(self, completed):
         self.leafs_searched += completed
         self.nodes_eliminated.append(completed)
 
@@ -29,4 +35,7 @@ class BeamEtaPredictor:
         percent_complete = 100 * self.leafs_searched / self.total_leafs
 
         msg = f"{percent_complete:.2f}% Complete.  Searching {self.total_leafs:,.0f} total schedules.  Evaluating {per_second:,.0f} per second..."
-        self.progress_callback(increment, msg)
\ No newline at end of file
+        self.progress_callback(increment, msg)
+
+    def fraction_searched(self) -> float:
+        return self.leafs_searched / self.total_leafs
\ No newline at end of file
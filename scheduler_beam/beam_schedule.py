@@ -1,25 +1,45 @@
-from functools import cache
-import statistics
-import traceback
-from typing import Any, List, Set
+from typing import Any, List, Optional, Set
 
+from scheduler.cancellation_token import CancellationToken
+from scheduler.lineup_index import LineupIndex
 from scheduler.progress_callback import ProgressCallback
 from scheduler_beam.beam_eta_predictor import BeamEtaPredictor
-from scheduler_beam.beam_inning import Inning, LineupNode
-from services.inning_service import get_all_possible_innings
+from services.inning_service import build_inning, get_all_possible_innings, get_lineup_strengths, get_player_masks
 from services.player_service import get_early_players, get_late_players
 from services.position_service import get_positions
+from softball_models.lineup_table import LineupTable
 from softball_models.player import Player
 
 from softball_models.schedule import Schedule
 from softball_models.schedule_config import QualityLevel, ScheduleConfig
 
+from utils.lru_cache import LruCache
 from utils.math import clamp, get_percentile_item
 from utils.timing import add_time, print_times
 
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import heapq
+import multiprocessing
 import time
 import math
 
+import numpy as np
+
+
+# Path hashes are sums of 64 bit lineup keys
+HASH_MASK = (1 << 64) - 1
+
+# Float error allowed when comparing bounds to scores, in the direction of searching more
+BOUND_TOLERANCE = 1e-9
+
+# Nodes searched between checks of the deadline and cancellation token
+STOP_CHECK_INTERVAL = 64
+
+# Lineups past a child's bound searched for its strongest fair continuation before all of them
+STRONGEST_FAIR_WINDOW = 4096
+
+# Fair lineups each partial schedule is expanded over in the breadth first search
+BEAM_BRANCHES = 40
 
 ########################################
 # Schedule - Our tree of possible linups
@@ -27,7 +47,8 @@ import math
     
 class BeamScheduler:
 
-    def __init__(self, players: List[Player], config: ScheduleConfig, progress_callback: ProgressCallback):
+    def __init__(self, players: List[Player], config: ScheduleConfig, progress_callback: ProgressCallback,
+                 deadline: Optional[float] = None, cancellation_token: Optional[CancellationToken] = None):
         self.config: ScheduleConfig = config
         self.players: List[Player] = players
         self.fairness: int = config.fair_factor
@@ -37,28 +58,100 @@ class BeamScheduler:
         self.early_players: List[Player] = get_early_players(players)
         self.all_players = self.late_players + self.early_players
 
-        self.late_lineups: List[Inning] = get_all_possible_innings(self.all_players, config.females_required)
-        self.early_lineups: List[Inning] = get_all_possible_innings(self.early_players, config.females_required)
+        # Early lineups first, the all players enumeration reuses them
+        self.early_lineups: LineupTable = get_all_possible_innings(self.early_players, config.females_required, workers=config.enumeration_workers, gray_code=config.enumeration_gray_code)
+        self.late_lineups: LineupTable = get_all_possible_innings(self.all_players, config.females_required, workers=config.enumeration_workers, gray_code=config.enumeration_gray_code)
+
+        #
+        # The search works on lineup indexes.  Bit i of a lineup mask, and count i of a node,
+        # is all_players[i].
+        #
+        self.late_masks: List[int] = get_player_masks(self.late_lineups, self.all_players).tolist()
+        self.early_masks: List[int] = get_player_masks(self.early_lineups, self.all_players).tolist()
+
+        self.late_strengths: List[float] = get_lineup_strengths(self.late_lineups).tolist()
+        self.early_strengths: List[float] = get_lineup_strengths(self.early_lineups).tolist()
+
+        # Strengths are rounded to tenths, so path sums are kept exactly as integer tenths
+        self.late_tenths: List[int] = [round(strength * 10) for strength in self.late_strengths]
+        self.early_tenths: List[int] = [round(strength * 10) for strength in self.early_strengths]
+        self.late_tenths_array = np.array(self.late_tenths, dtype=np.int64)
+        self.early_tenths_array = np.array(self.early_tenths, dtype=np.int64)
+
+        self.late_players_mask: int = sum(1 << i for i, p in enumerate(self.all_players) if p in self.late_players)
+        self.early_players_mask: int = sum(1 << i for i, p in enumerate(self.all_players) if p in self.early_players)
 
-        self.min_lineup: Inning = self.late_lineups[-1]
-        self.max_lineup: Inning = self.late_lineups[0]
+        self.late_index = LineupIndex(self.late_masks, self.late_strengths, len(self.all_players))
+        self.early_index = LineupIndex(self.early_masks, self.early_strengths, len(self.all_players))
+
+        self.min_strength: float = self.late_strengths[-1]
+        self.max_strength: float = self.late_strengths[0]
+        self.upper_strength: float = max(self.late_strengths[:1] + self.early_strengths[:1])
+
+        #
+        # A random key per lineup, separate for each phase so an early lineup never hashes
+        # like the late lineup with the same index.  A path's hash is the sum of its keys,
+        # the same whatever order the lineups were picked in.
+        #
+        rng = np.random.default_rng(0)
+        self.late_keys: List[int] = rng.integers(0, HASH_MASK, len(self.late_lineups), dtype=np.uint64, endpoint=True).tolist()
+        self.early_keys: List[int] = rng.integers(0, HASH_MASK, len(self.early_lineups), dtype=np.uint64, endpoint=True).tolist()
+        self.late_keys_array = np.array(self.late_keys, dtype=np.uint64)
+        self.early_keys_array = np.array(self.early_keys, dtype=np.uint64)
 
         self.best_score: float = 0
-        self.paths: Set[Any] = set()
 
-        self.percentiles = { 
+        # Best score across worker processes, when searching in parallel
+        self.incumbent: Any = None
+
+        # The search stops at the deadline, a time.time(), or when cancelled
+        self.deadline = deadline
+        self.cancellation_token = cancellation_token
+        self.stopped = False
+        self.nodes_since_check = 0
+
+        # Memos for this search only, so concurrent schedules don't share or clear each other's
+        self.fair_lineups_cache = LruCache(config.beam_cache_entries, config.beam_cache_bytes)
+        self.minimum_viable_score_cache = LruCache(config.beam_cache_entries, config.beam_cache_bytes)
+        self.strongest_fair_cache = LruCache(config.beam_cache_entries, config.beam_cache_bytes)
+
+        percentiles = { 
             QualityLevel.HIGH: [0, 0.01, 0.02, 0.05, 0.1, 0.15, 0.2, 0.25, 0.3, 0.4, 0.5, 0.7, 1],
             QualityLevel.MEDIUM: [0, 0.02, 0.05, 0.1, 0.2, 0.25, 0.5, 0.7],
             QualityLevel.LOW: [0, 0.02, 0.05, 0.15]
-            }[config.quality_level]
-        
-        self.reporter = BeamEtaPredictor(progress_callback, 
-                                         len(self.percentiles),
-                                         config.number_innings)
+            }
+
+        #
+        # The tree searches every quality level up to the configured one, each seeded with the
+        # best found by the ones before, so a higher level never ends on a worse schedule.
+        # Their trees aren't nested, what a node's percentiles pick depends on the best found so far.
+        #
+        # The minimum viable score cut, and so the percentiles, depend on the schedules kept too.
+        # The levels keep only the best, then alternatives are searched for seeded with it, so
+        # asking for them never changes the best schedule for a worse one.
+        #
+        levels = list(QualityLevel)
+        self.passes: List[tuple] = [(percentiles[level], 1) for level in levels[:levels.index(config.quality_level) + 1]]
+        if config.beam_schedules_kept > 1:
+            self.passes.append((percentiles[config.quality_level], config.beam_schedules_kept))
+        self.percentiles = percentiles[config.quality_level]
+        self.schedules_kept = config.beam_schedules_kept
+
+        # The breadth first search reports each partial schedule it expands, the tree each configured level pass
+        total_leafs = config.beam_width * config.number_innings
+        if config.beam_width == 0:
+            total_leafs = sum(1 for p, _ in self.passes if p is self.percentiles) * len(self.percentiles) ** config.number_innings
+
+        self.progress_reporter = BeamEtaPredictor(progress_callback, 
+                                                  len(self.percentiles),
+                                                  config.number_innings,
+                                                  total_leafs)
+        self.reporter = self.progress_reporter
     @staticmethod
-    def create(players: List[Player], config: ScheduleConfig, progress_callback: ProgressCallback):
+    def create(players: List[Player], config: ScheduleConfig, progress_callback: ProgressCallback,
+               deadline: Optional[float] = None, cancellation_token: Optional[CancellationToken] = None):
 
-        scheduler = BeamScheduler(players, config, progress_callback)
+        scheduler = BeamScheduler(players, config, progress_callback, deadline, cancellation_token)
         return scheduler.schedule()
 
     def schedule(self):
@@ -66,228 +159,837 @@ class BeamScheduler:
         start = time.time()
         print("create", self.players)
 
-        root = LineupNode.root(self.early_players)
-      
         print("creating tree....")
         print("number lineups late", len(self.late_lineups))
         print("number lineups early", len(self.early_lineups))
         print("Num players", len(self.all_players))
 
-        leaf_nodes: List[LineupNode] = []
-        self._depth_first(root, leaf_nodes)
-        print("number of lineups created:", len(leaf_nodes))
-        
+        if self.config.beam_width > 0:
+            self._breadth_first()
+        elif self.config.beam_workers > 1:
+            self._parallel_depth_first()
+        else:
+            self._depth_first()
+        print("number of lineups created:", self.leaf_count)
+
+        if not self.best_leaves and self.stopped:
+            raise Exception("Search stopped before a schedule was found")
+        if not self.best_leaves:
+            raise Exception("No fair schedule found")
+
         #
-        # A leaf node represents the final lineup
-        # Sort the leaf nodes by their strength, weighted by sigma (standard deviation between innings)
-        # This should favor strong lineups that have low inning to inning deviation
+        # Get the top lineups
+        # These should be strong lineups that have low standard deviation
         #
-        leaf_nodes.sort(key=lambda node : -1*self._score(node))
+        best = sorted(self.best_leaves, reverse=True)
+        print("final score", best[0][0])
+
+        schedule = self._build_schedule(best[0][2])
+        schedule.alternatives = [self._build_schedule(path) for _, _, path in best[1:]]
+        schedule.partial = self.stopped
+        schedule.fraction_explored = self.progress_reporter.fraction_searched()
+        if schedule.partial:
+            schedule.warnings.append(f"Search stopped early, {schedule.fraction_explored:.0%} of schedules were searched.")
+        schedule.cache_stats = {
+            "fair_lineups": self.fair_lineups_cache.stats(),
+            "minimum_viable_score": self.minimum_viable_score_cache.stats(),
+            "strongest_fair": self.strongest_fair_cache.stats(),
+        }
+
+        end = time.time()
+        print("Beam Schedule took: ", end - start, " seconds.")
+        print_times()
+        print("fair lineups", schedule.cache_stats["fair_lineups"])
+        print("min viable", schedule.cache_stats["minimum_viable_score"])
+        print("strongest fair", schedule.cache_stats["strongest_fair"])
+        return schedule
 
+    def _build_schedule(self, path: tuple) -> Schedule:
+        """
+        Schedule from the lineup index of each inning.
+        """
         schedule = Schedule()
         schedule.players = self.all_players
         schedule.config = self.config
         schedule.positions = get_positions(len(self.all_players), allow_not_enough=True)
 
+        for i, lineup in enumerate(path, start=1):
+            inning = build_inning(self._get_lineups(i), lineup)
+            schedule.innings.append(inning)
+
+            if i < self.config.inning_of_late_arrivals:
+                inning.late = self.late_players
+
+        return schedule
+
+    def _is_late(self, inning):
+        return self.config.inning_of_late_arrivals <= inning
+
+    def _get_lineups(self, inning) -> LineupTable:
+        return self.late_lineups if self._is_late(inning) else self.early_lineups
+
+    def _get_index(self, inning) -> LineupIndex:
+        return self.late_index if self._is_late(inning) else self.early_index
+
+    def _get_tenths(self, inning) -> List[int]:
+        return self.late_tenths if self._is_late(inning) else self.early_tenths
+
+    def _get_tenths_array(self, inning) -> np.ndarray:
+        return self.late_tenths_array if self._is_late(inning) else self.early_tenths_array
+
+    def _get_keys(self, inning) -> List[int]:
+        return self.late_keys if self._is_late(inning) else self.early_keys
+
+    def _get_keys_array(self, inning) -> np.ndarray:
+        return self.late_keys_array if self._is_late(inning) else self.early_keys_array
+
+    def _get_playing_mask(self, inning) -> int:
+        """
+        Players that have arrived by this inning, these are the ones counted for fairness.
+        """
+        if self._is_late(inning):
+            return self.early_players_mask | self.late_players_mask
+        return self.early_players_mask
+
+    def _score(self, count: int, total: int, squares: int):
+        """
+        mean - sigma_weight*stddev of count strengths, from the sum of their tenths and of their tenths squared.
+        """
+        mean = total / (10 * count)
+        stddev = math.sqrt(count * squares - total * total) / (10 * count)
+
+        return mean - stddev*self.sigma_weight
+
+    def _depth_first(self):
+        """
+        Searches the tree of lineups depth first with an explicit stack.
+
+        The path being searched is kept in arrays with a row per depth, so memory doesn't
+        grow with the number of nodes visited.  Depth 0 is the root, depth i holds the
+        lineup of inning i.  Only the best leaves' paths are kept.
+        """
+        start = time.time()
+
+        self._start_search()
+        for percentiles, kept in self.passes:
+            self._start_pass(percentiles, kept)
+            self._seed()
+            if not self.stopped and self._enter(0):
+                self._search(0)
+
+        add_time("depth_first", start)
+
+    def _parallel_depth_first(self):
+        """
+        Searches each of the root's branches in its own task across a pool of processes.
+
+        Workers share the best score found so far so every one of them prunes against it.
+        Which nodes get pruned then depends on timing, so unlike the single process search
+        the result can vary from run to run.
+        """
+        start = time.time()
+
+        self._start_search()
+
+        # Workers check the deadline and cancellation token themselves
+        incumbent = multiprocessing.Value("d", 0)
+        executor = None
+
+        for percentiles, kept in self.passes:
+            self._start_pass(percentiles, kept)
+            self._seed()
+
+            # Every worker builds its own scheduler before searching, so don't start them past the deadline
+            if self._check_stop():
+                break
+            if not self._enter(0):
+                continue
+
+            if executor is None:
+                executor = ProcessPoolExecutor(max_workers=self.config.beam_workers, initializer=_start_branch_worker,
+                                               initargs=(self.players, self.config, incumbent, self.deadline, self.cancellation_token))
+            with incumbent.get_lock():
+                incumbent.value = max(incumbent.value, self.best_score)
+
+            self._search_branches(executor, incumbent)
+
+        if executor is not None:
+            executor.shutdown()
+
+        add_time("parallel_depth_first", start)
+
+    def _search_branches(self, executor: ProcessPoolExecutor, incumbent: Any):
+        """
+        Searches the root's branches with the workers, for the percentiles being searched.
+        """
+        seed = self.best_leaves
+
+        # Percentiles landing on the same lineup would be the same branch
+        branches = list(dict.fromkeys(int(get_percentile_item(self.candidates[0], percentile)) for percentile in self.percentiles))
+        for _ in range(len(self.percentiles) - len(branches)):
+            self.reporter.report(2)
+
+        futures = {executor.submit(_search_branch, lineup, self.percentiles, self.schedules_kept): i for i, lineup in enumerate(branches)}
+
+        results = [None] * len(branches)
+        for future in as_completed(futures):
+            best_leaves, leaf_count, leafs_searched, stopped = future.result()
+            results[futures[future]] = (best_leaves, leaf_count)
+            self.reporter.report_leafs(leafs_searched)
+            self.stopped |= stopped
+
         #
-        # Get the top lineup
-        # This should be a strong lineup that has low standard deviation
+        # Merge the best leaves of each branch, ties go to the seed, the earlier branch then
+        # the earlier leaf like in the single process search
         #
-        node = leaf_nodes[0]
-        print("final score", self._score(node))
-        # print(node.cumulative_strength/6)
+        leaves = [(score, 1, leaf, path) for score, leaf, path in seed]
+        for branch, (best_leaves, leaf_count) in enumerate(results):
+            leaves += [(score, -branch, leaf, path) for score, leaf, path in best_leaves]
+            self.leaf_count += leaf_count
+
+        # Branches can find a seed's schedule again, only the first of each is kept
+        best = {}
+        for leaf in sorted(leaves, reverse=True):
+            best.setdefault(self._get_path_hash(leaf[3]), leaf)
+        leaves = list(best.values())[:self.schedules_kept]
+
+        self.best_leaves = [(score, -rank, path) for rank, (score, _, _, path) in enumerate(leaves)]
+        self.best_hashes = {self._get_path_hash(path) for _, _, path in self.best_leaves}
+        self.best_score = max(self.best_score, incumbent.value)
+
+    def _breadth_first(self):
+        """
+        Searches the tree an inning at a time, keeping the beam_width most promising partial
+        schedules at each one.
+
+        Every partial schedule is expanded over BEAM_BRANCHES of its fair lineups, evenly
+        spread from the strongest to the weakest, all of them scored at once.  Ranking by the
+        best score they could reach alone would fill the beam with strong starts that fairness
+        makes pay later, so children are ranked as if the rest of their innings could be no
+        stronger than their strongest fair next lineup.  Orders of the same lineups end with
+        the same rebased counts and path hash, only the best ranked of them is kept.
+
+        The cost is linear in the innings and the width, instead of exponential like the
+        percentile tree's.  Always searched in a single process.
+        """
+        start = time.time()
+
+        self._start_search()
+        self._seed()
 
-        end_node = node
-        # print(end_node.cumulative_strength/self.config.number_innings)
-        # print(end_node.sigma)
+        width = self.config.beam_width
+        max_depth = self.config.number_innings
 
-        i = self.config.number_innings
-        while node and node.lineup:
-            # TODO clean this up, could do a node_to_schedule function
-            schedule.innings.append(node.lineup)
+        # The beam, a row per partial schedule
+        counts = np.zeros((1, len(self.all_players)), dtype=np.uint8)
+        totals = np.zeros(1, dtype=np.int64)
+        squares = np.zeros(1, dtype=np.int64)
+        hashes = np.zeros(1, dtype=np.uint64)
+        paths = np.zeros((1, 0), dtype=np.intp)
 
-            if i < self.config.inning_of_late_arrivals:
-                node.lineup.late = self.late_players
+        for inning in range(1, max_depth + 1):
+            remaining = max_depth - inning
+            self._rebase_rows(counts, inning)
 
-            node = node.prev
-            i -= 1
+            parents, lineups, bounds = [], [], []
+            for row in range(len(counts)):
+                if self._should_stop():
+                    break
 
-        schedule.innings.reverse()
+                fair = self._get_fair_lineups(counts[row].tobytes(), inning)
+                fair = fair[np.unique(np.linspace(0, len(fair) - 1, BEAM_BRANCHES).round().astype(np.intp))] if len(fair) else fair
 
-        end = time.time()
-        print("Beam Schedule took: ", end - start, " seconds.")
-        print_times()
-        print("fair lineups", self._get_fair_lineups.cache_info())
-        print("min viable", self._minimum_viable_score.cache_info())
-        print(self._minimum_viable_score.cache_clear())
-        print(self._get_fair_lineups.cache_clear())
-        return schedule
-    
-    
-    def _get_lineups(self, inning):
-        if self.config.inning_of_late_arrivals <= inning:
-            return self.late_lineups
-        else:
-            return self.early_lineups
-        
-    def _score(self, node: LineupNode):
-        strengths = []
-        prev = node
-        while prev and prev.lineup:
-            strengths.append(prev.lineup.strength)
-            prev = prev.prev
-
-        mean = statistics.mean(strengths)
-        stddev = statistics.pstdev(strengths)
+                tenths = self._get_tenths_array(inning)[fair]
+                scores, _ = self._get_optimistic_scores(inning, totals[row] + tenths, squares[row] + tenths * tenths,
+                                                        remaining, self.upper_strength)
+                parents.append(np.full(len(fair), row))
+                lineups.append(fair)
+                bounds.append(scores)
+                self.reporter.report_leafs(1)
 
-        return mean - stddev*self.sigma_weight
- 
-    def _depth_first(self, node: LineupNode, results: List[Any], current_depth: int = 1):
+            if self.stopped:
+                break
+            self.reporter.report_leafs(width - len(counts))
+
+            parents = np.concatenate(parents)
+            lineups = np.concatenate(lineups)
+            bounds = np.concatenate(bounds)
+
+            # Drop children that can't make the best kept
+            promising = np.flatnonzero(bounds + BOUND_TOLERANCE >= self._get_score_to_beat())
+            parents, lineups = parents[promising], lineups[promising]
+
+            tenths = self._get_tenths_array(inning)[lineups]
+            child_counts = counts[parents] + self._get_index(inning).incidence[:, lineups].T.view(np.uint8)
+            child_totals = totals[parents] + tenths
+            child_squares = squares[parents] + tenths * tenths
+            child_hashes = hashes[parents] + self._get_keys_array(inning)[lineups]
+
+            estimates = self._estimate_scores(inning, child_counts, child_totals, child_squares)
+            order = np.argsort(-estimates, kind="stable")
+
+            # First of each rebased counts and multiset of lineups in rank order, then the best width
+            key = np.concatenate([child_counts, child_hashes.view(np.uint8).reshape(-1, 8)], axis=1)[order]
+            _, first = np.unique(key, axis=0, return_index=True)
+            kept = order[np.sort(first)[:width]]
+
+            counts = child_counts[kept]
+            totals = child_totals[kept]
+            squares = child_squares[kept]
+            hashes = child_hashes[kept]
+            paths = np.concatenate([paths[parents[kept]], lineups[kept, None]], axis=1)
+
+            if not len(counts):
+                # Nothing left to expand in the innings to go
+                self.reporter.report_leafs(width * remaining)
+                break
+        else:
+            for row in range(len(paths)):
+                self._add_leaf(int(totals[row]), int(squares[row]), tuple(paths[row].tolist()))
+
+        add_time("breadth_first", start)
+
+    def _estimate_scores(self, inning: int, counts: np.ndarray, totals: np.ndarray, squares: np.ndarray) -> np.ndarray:
+        """
+        Score each partial schedule could reach if its remaining innings were at most its
+        strongest fair lineup for the next inning, -inf when it has none.
+
+        Only an estimate, later innings can be stronger once the counts even out.
+        """
+        remaining = self.config.number_innings - inning
+        if remaining == 0:
+            return self._get_optimistic_scores(inning, totals, squares, 0, self.upper_strength)[0]
+
+        # Rebased like _enter does, partial schedules often share them
+        counts = counts.copy()
+        self._rebase_rows(counts, inning + 1)
+        unique_counts, inverse = np.unique(counts, axis=0, return_inverse=True)
+
+        strongest = np.empty(len(unique_counts), dtype=np.int64)
+        for i in range(len(unique_counts)):
+            found = self._get_strongest_fair(unique_counts[i].tobytes(), inning + 1, 0)
+            strongest[i] = self._get_tenths(inning + 1)[found] if found >= 0 else -1
+        strongest = strongest[inverse.ravel()]
+
+        estimates, _ = self._get_optimistic_scores(inning, totals, squares, remaining, strongest / 10)
+        return np.where(strongest < 0, -math.inf, estimates)
+
+    def search_branch(self, lineup: int, percentiles: List[float], kept: int):
+        """
+        Searches the subtree under the root's child with the given lineup, picking children
+        at the given percentiles and keeping the kept best leaves.
+
+        Returns:
+            The best leaves found, the number of leaves, the number of leaves searched or
+            pruned for the progress report, and whether the search stopped early.
+        """
+        leafs_searched = self.reporter.leafs_searched
+
+        # The root has no counts to rebase and is already counted by the coordinator
+        self._start_search()
+        self.percentiles = percentiles
+        self.schedules_kept = kept
+        child = self._descend(0, lineup)
+        if not self._check_stop() and self._enter(child):
+            self._search(child)
+
+        return self.best_leaves, self.leaf_count, self.reporter.leafs_searched - leafs_searched, self.stopped
+
+    def _seed(self):
+        """
+        Adds greedy schedules as the first leaves, so pruning has a best score to work
+        against from the first branch.
+
+        The objective rewards consistent innings, so each greedy schedule aims at a target
+        strength, a percentile of the lineups like the search's.  Every inning takes the
+        weakest fair lineup at least that strong, or the strongest one when there's none.
+        """
         start = time.time()
 
-        if node.hash in self.paths:
-            self.reporter.report(current_depth)
-            return
-        self.paths.add(node.hash)
+        for percentile in self.percentiles:
+            # Enumerating the lineups may have used up the time, one schedule is still needed to answer
+            if self.best_leaves and self._check_stop():
+                break
+
+            target = get_percentile_item(self.late_tenths, percentile)
+
+            depth = 0
+            while depth < self.config.number_innings:
+                current_depth = depth + 1
+                self._rebase(depth, current_depth)
+
+                lineups = self._get_fair_lineups(self.counts[depth].tobytes(), current_depth)
+                if not len(lineups):
+                    break
+
+                # Fair lineups are strongest first
+                tenths = self._get_tenths_array(current_depth)[lineups]
+                at_least = int(np.searchsorted(-tenths, -target, side="right"))
+                depth = self._descend(depth, int(lineups[max(at_least - 1, 0)]))
+            else:
+                self._add_leaf(self.totals[depth], self.squares[depth], tuple(self.path[1:].tolist()))
+
+        add_time("seed", start)
+
+    def _start_pass(self, percentiles: List[float], kept: int):
+        """
+        Searches the tree with the given percentiles and number of schedules kept next, keeping
+        the best leaves found so far.  Only the configured quality level reports progress, the
+        lower ones before it are quick.
+        """
+        configured = self.passes[-1][0]
+        self.percentiles = percentiles
+        self.schedules_kept = kept
+        self.reporter = self.progress_reporter
+        if percentiles is not configured:
+            self.reporter = BeamEtaPredictor(lambda increment, msg: None, len(percentiles), self.config.number_innings)
+
+    def _start_search(self):
+        max_depth = self.config.number_innings
+        num_players = len(self.all_players)
+
+        self.path = np.zeros(max_depth + 1, dtype=np.intp)                   # lineup index at each depth
+        self.counts = np.zeros((max_depth + 1, num_players), dtype=np.uint8)  # innings played, rebased at each depth
+        self.totals: List[int] = [0] * (max_depth + 1)                       # sum of strength tenths to each depth
+        self.squares: List[int] = [0] * (max_depth + 1)                      # sum of squared strength tenths to each depth
+        self.candidates: List[Any] = [None] * (max_depth + 1)                # fair lineups to pick children from
+        self.children: List[List[int]] = [[] for _ in range(max_depth + 1)]  # child lineups, most promising first
+        self.child_bounds: List[List[float]] = [[] for _ in range(max_depth + 1)]  # best score each child could reach
+        self.next_child = np.zeros(max_depth + 1, dtype=np.intp)            # next child to try
+
+        # Min heap of the best (score, -leaf number, lineup indexes), earlier leaves win ties
+        self.best_leaves: List[tuple] = []
+        self.best_hashes: Set[int] = set()  # path hashes of the best leaves
+        self.leaf_count = 0
+
+    def _search(self, depth: int):
+        """
+        Searches the subtree under the node at depth, which has been entered.
+        """
+        top = depth
+        while depth >= top and not self._should_stop():
+            if self.next_child[depth] == len(self.children[depth]):
+                # Backtrack, the subtree is done
+                depth -= 1
+                continue
+
+            i = self.next_child[depth]
+            if self.child_bounds[depth][i] + BOUND_TOLERANCE < self._get_score_to_beat():
+                # Children are in bound order, so none of the rest can make the best kept either
+                for _ in range(i, len(self.children[depth])):
+                    self.reporter.report(depth + 2)
+                self.next_child[depth] = len(self.children[depth])
+                continue
+            self.next_child[depth] += 1
+
+            child = self._descend(depth, self.children[depth][i])
+            if self._enter(child):
+                depth = child
+
+    def _should_stop(self) -> bool:
+        """
+        Whether the deadline has passed or the search was cancelled.  The search then returns
+        the best schedule found so far.  Only checked every STOP_CHECK_INTERVAL nodes.
+        """
+        self.nodes_since_check += 1
+        if self.stopped or self.nodes_since_check < STOP_CHECK_INTERVAL:
+            return self.stopped
+        self.nodes_since_check = 0
+
+        return self._check_stop()
+
+    def _check_stop(self) -> bool:
+        """
+        Checks the deadline and the cancellation token now, outside the search loops.
+        """
+        if self.deadline is not None and time.time() >= self.deadline:
+            self.stopped = True
+        if self.cancellation_token is not None and self.cancellation_token.cancelled:
+            self.stopped = True
+        return self.stopped
+
+    def _descend(self, depth: int, lineup: int) -> int:
+        """
+        Puts the child with lineup after the node at depth on the path.  The child's counts
+        are this node's plus the child's lineup.
+        """
+        child = depth + 1
+        self.path[child] = lineup
+        tenths = self._get_tenths(child)[lineup]
+        self.totals[child] = self.totals[depth] + tenths
+        self.squares[child] = self.squares[depth] + tenths * tenths
+        np.add(self.counts[depth], self._get_index(child).incidence[:, lineup].view(np.uint8), out=self.counts[child])
+        return child
+
+    def _enter(self, depth: int) -> bool:
+        """
+        Visits the node at depth on the current path.
+
+        Returns:
+            True when the node has children to search.
+        """
+        current_depth = depth + 1
 
         if current_depth > self.config.number_innings:
             # we have a leaf node
-            results.append(node)
-            score = self._score(node)
-            if self.best_score <= score:
-                self.best_score = score
+            self._add_leaf(self.totals[depth], self.squares[depth], tuple(self.path[1:].tolist()))
             self.reporter.report(current_depth)
-            return
-        
-        lineups = self._get_potential_lineups(node, current_depth)
-      
-        if not lineups:
+            return False
+
+        self._rebase(depth, current_depth)
+        lineups = self._get_potential_lineups(depth, current_depth)
+
+        if not len(lineups):
             self.reporter.report(current_depth)
-            return
-        
-        for percentile in self.percentiles:
-            try:
-                lineup = get_percentile_item(lineups, percentile)
-                next = LineupNode(lineup, node)
+            return False
+
+        self.candidates[depth] = lineups
+        self._order_children(depth, current_depth)
+        return True
+
+    def _order_children(self, depth: int, current_depth: int):
+        """
+        Picks the node's children at the percentiles of its fair lineups, and orders them by
+        the best score they could reach so a strong schedule is found early and prunes the rest.
+        """
+        # Percentiles landing on the same lineup would be the same child
+        children = list(dict.fromkeys(int(get_percentile_item(self.candidates[depth], percentile)) for percentile in self.percentiles))
+        for _ in range(len(self.percentiles) - len(children)):
+            self.reporter.report(current_depth + 1)
+
+        bounds = self._get_child_bounds(depth, children)
+        order = np.argsort(-bounds, kind="stable")
+
+        self.children[depth] = [children[i] for i in order]
+        self.child_bounds[depth] = bounds[order].tolist()
+        self.next_child[depth] = 0
+
+    def _get_child_bounds(self, depth: int, children: List[int]) -> np.ndarray:
+        """
+        Highest score each child could reach.
+
+        The next inning can be no stronger than the child's strongest fair lineup past its
+        canonical bound, and with lineup indexes never going down, neither can the rest of
+        that phase.  The innings after it are at most the strongest late lineup.
+        """
+        c = depth + 1
+        r = self.config.number_innings - c
+
+        # Exact in integer tenths, so an even path has no variance at all
+        tenths = self._get_tenths_array(c)[children]
+        totals = self.totals[depth] + tenths
+        squares = self.squares[depth] + tenths * tenths
+
+        bounds, best = self._get_optimistic_scores(c, totals, squares, r, self.upper_strength)
+        if r == 0:
+            return bounds
+
+        strongest = self._get_strongest_continuations(depth, children)
+
+        # The remaining innings in the next inning's phase
+        phase = sum(1 for inning in range(c + 1, self.config.number_innings + 1) if self._is_late(inning) == self._is_late(c + 1))
 
-                self._depth_first(next, results, current_depth+1)
+        #
+        # The score is concave and symmetric in the phase's innings, so when the unconstrained
+        # best is stronger than they can be, the best has them all at their cap.
+        #
+        capped, _ = self._get_optimistic_scores(c + phase, totals + phase * strongest, squares + phase * strongest * strongest,
+                                                r - phase, self.max_strength)
+        bounds = np.where(best * 10 > strongest, capped, bounds)
+
+        # Children with no fair continuation can't reach a full schedule
+        return np.where(strongest < 0, -math.inf, bounds)
+
+    def _get_optimistic_scores(self, c: int, totals: np.ndarray, squares: np.ndarray, r: int, cap: Any) -> tuple:
+        """
+        Highest score after c innings with the given tenths sums, if the r innings to go could
+        be any strength up to cap, one for all or one each.  Also returns the strength they'd be at.
+
+        The objective is concave and symmetric in the remaining innings, so the best has them
+        all at one strength v.  With mean a and variance s² so far, d = v - a scores
+        a + rd/n - w·sqrt(cs²/n + crd²/n²), n = c + r, w = sigma_weight.
+        That peaks at d = sqrt(ns²/(w²c - r)), or keeps rising when w²c <= r.
+        """
+        n = c + r
+        weight = self.sigma_weight
 
-            except Exception as e:
-                traceback.print_exc()
-                break
+        mean = totals / (10 * c)
+        variance = (c * squares - totals * totals) / (100 * c * c)
 
-        add_time("depth_first", start)
+        best = np.zeros(len(totals)) + cap
+        if weight * weight * c > r:
+            best = np.minimum(mean + np.sqrt(n * variance / (weight * weight * c - r)), cap)
 
-    def _get_potential_lineups(self, node: LineupNode, depth: int):
-        if depth == self.config.inning_of_late_arrivals:
-            node.cumulative_counts.add_players(self.late_players)
+        d = best - mean
+        return mean + r * d / n - weight * np.sqrt(c * variance / n + c * r * d * d / (n * n)), best
 
-        minimum_viable_score = 0
-        if depth > 1 and self.best_score != 0:
-            minimum_viable_score = self._minimum_viable_score(frozenset(node.get_stregnths()), depth)
+    def _get_strongest_continuations(self, depth: int, children: List[int]) -> np.ndarray:
+        """
+        Tenths of each child's strongest fair lineup for the inning after it, -1 when it has none.
+        """
+        child = depth + 1
+        current_depth = child + 1
+        index = self._get_index(child)
+
+        # The children's counts, rebased like _enter does
+        counts = self.counts[depth] + index.incidence[:, children].T.view(np.uint8)
+        self._rebase_rows(counts, current_depth)
 
-        node.cumulative_counts.rebase()
-        return self._get_fair_lineups(frozenset(node.cumulative_counts.counter.items()), depth, int(minimum_viable_score))
+        # The bound _get_bound gives each child
+        same_phase = self._is_late(child) == self._is_late(current_depth)
 
+        strongest = np.empty(len(children), dtype=np.int64)
+        for i, lineup in enumerate(children):
+            found = self._get_strongest_fair(counts[i].tobytes(), current_depth, lineup if same_phase else 0)
+            strongest[i] = self._get_tenths(current_depth)[found] if found >= 0 else -1
+
+        return strongest
+
+    def _get_strongest_fair(self, counts: bytes, current_depth: int, bound: int) -> int:
+        """
+        Index of the strongest fair lineup at or past bound, -1 when there is none.
+        """
+        key = (counts, current_depth, bound)
+        found = self.strongest_fair_cache.get(key)
+        if found is not None:
+            return found
 
-    @cache
-    def _get_fair_lineups(self, counts: frozenset, current_depth: int, minimum: int = 0):
         start = time.time()
-        fair_lineups = []
 
-        lineups = self._get_lineups(current_depth)
+        num_lineups = self._get_index(current_depth).num_lineups
+        found = -1
 
-        counts_items = list(counts)
-        first_key, first_val = counts_items[0]
-        rest_items = counts_items[1:]
+        # Usually one is near the bound, so only a window of the bitsets is needed
+        for count in dict.fromkeys([min(bound + STRONGEST_FAIR_WINDOW, num_lineups), num_lineups]):
+            fair = self._get_fair_bitset(counts, current_depth, count)
+            fair[:bound // 64] = 0
+            if bound // 64 < len(fair):
+                fair[bound // 64] &= ~np.uint64((1 << (bound % 64)) - 1)
 
-        fairness = self.fairness
+            words = np.flatnonzero(fair)
+            if len(words):
+                word = int(fair[words[0]])
+                found = int(words[0]) * 64 + (word & -word).bit_length() - 1
+                break
+
+        self.strongest_fair_cache.put(key, found)
+
+        add_time("get_strongest_fair", start)
+
+        return found
+
+    def _get_score_to_beat(self) -> float:
+        """
+        Score a leaf needs to make the best kept.  Keeping one, it needs to beat the best
+        any worker has found, the seed included, not just this one's.
+        """
+        score = -math.inf
+        if len(self.best_leaves) == self.schedules_kept:
+            score = self.best_leaves[0][0]
+        if self.incumbent is not None and self.schedules_kept == 1:
+            score = max(score, self.incumbent.value)
+        return score
+
+    def _add_leaf(self, total: int, squares: int, path: tuple):
+        self.leaf_count += 1
+        score = self._score(self.config.number_innings, total, squares)
+        if self.best_score <= score:
+            self.best_score = score
+
+            # Share it with the other workers
+            if self.incumbent is not None:
+                with self.incumbent.get_lock():
+                    if score > self.incumbent.value:
+                        self.incumbent.value = score
+
+        # Anything not in the best kept is dropped straight away
+        leaf = (score, -self.leaf_count, path)
+        if len(self.best_leaves) == self.schedules_kept and leaf < self.best_leaves[0]:
+            return
 
         #
-        # Determine which lineups are 'fair' for this inning
-        # and add them to the list. 
+        # The same innings in another order within a phase is the same schedule, found again
+        # when a seed isn't in canonical order
         #
-        for lineup in lineups:
+        path_hash = self._get_path_hash(path)
+        if path_hash in self.best_hashes:
+            return
+        self.best_hashes.add(path_hash)
 
-            if lineup.strength < minimum:
-                break
+        if len(self.best_leaves) < self.schedules_kept:
+            heapq.heappush(self.best_leaves, leaf)
+        else:
+            dropped = heapq.heapreplace(self.best_leaves, leaf)
+            self.best_hashes.discard(self._get_path_hash(dropped[2]))
+
+    def _get_path_hash(self, path: tuple) -> int:
+        return sum(self._get_keys(inning)[lineup] for inning, lineup in enumerate(path, start=1)) & HASH_MASK
+
+    def _rebase(self, depth: int, current_depth: int):
+        # Late players join at 0 when they arrive, then everyone is re-baselined
+        counts = self.counts[depth]
+        playing = self._get_players(self._get_playing_mask(current_depth))
+        counts[playing] -= counts[playing].min()
+
+    def _rebase_rows(self, counts: np.ndarray, current_depth: int):
+        # Like _rebase, for a row of counts per partial schedule
+        playing = self._get_players(self._get_playing_mask(current_depth))
+        counts[:, playing] -= counts[:, playing].min(axis=1, keepdims=True)
+
+    def _get_potential_lineups(self, depth: int, current_depth: int):
+        # Lineups too weak to get a schedule into the best kept are left out
+        goal = self._get_score_to_beat()
+        minimum_viable_score = 0
+        if current_depth > 1 and goal > -math.inf:
+            minimum_viable_score = self._minimum_viable_score(depth, self.totals[depth], self.squares[depth], current_depth, goal)
+
+        # Rebased counts are at most the number of innings, so they're packed a byte per player
+        lineups = self._get_fair_lineups(self.counts[depth].tobytes(), current_depth, int(minimum_viable_score))
+
+        return lineups[np.searchsorted(lineups, self._get_bound(depth, current_depth)):]
+
+    def _get_bound(self, depth: int, current_depth: int) -> int:
+        """
+        Lowest lineup index the next inning can take.
+
+        The score and the final counts don't depend on the order of the innings within a
+        phase, so each phase is searched in canonical order, lineup indexes never going down,
+        and the other orders of the same innings are skipped before they're built.  Fairness
+        is checked after every inning though, so a set of innings whose canonical order isn't
+        fair partway is skipped even when another order of it is fair, and a node's children
+        are picked at the percentiles of its fair lineups past the bound.
+        """
+        if depth > 0 and self._is_late(depth) == self._is_late(current_depth):
+            return int(self.path[depth])
+        return 0
+
+    def _get_players(self, mask: int) -> List[int]:
+        return [i for i in range(len(self.all_players)) if mask >> i & 1]
+
+    def _get_fair_lineups(self, counts: bytes, current_depth: int, minimum: int = 0):
+        key = (counts, current_depth, minimum)
+        fair_lineups = self.fair_lineups_cache.get(key)
+        if fair_lineups is not None:
+            return fair_lineups
 
-            fair = True
+        start = time.time()
 
-            first_it_inc = 0
-            if first_key in lineup.playing_ids:
-                first_it_inc = 1
+        index = self._get_index(current_depth)
+        fair = self._get_fair_bitset(counts, current_depth, index.count_at_least(minimum))
 
-            min = first_val + first_it_inc
-            max = min
+        fair_lineups = index.lineups(fair)
+        self.fair_lineups_cache.put(key, fair_lineups)
 
-            for id, count in rest_items:
-                if id in lineup.playing_ids:
-                    count += 1
+        add_time("get_fair_lineups", start)
 
-                if count < min:
-                    min = count
-                elif count > max:
-                    max = count
+        return fair_lineups
 
-                if max - min > fairness:
-                    fair = False
-                    break
+    def _get_fair_bitset(self, counts: bytes, current_depth: int, count: int) -> np.ndarray:
+        """
+        Bitset of the first count lineups that keep the players within fairness of each other.
+        """
+        index = self._get_index(current_depth)
 
-            if fair:
-                fair_lineups.append(lineup)
+        playing = self._get_players(self._get_playing_mask(current_depth))
+        lowest = min(counts[i] for i in playing)
+        highest = max(counts[i] for i in playing)
 
-        add_time("get_fair_lineups", start)
+        # Players that have played the fewest and the most innings
+        lowest_mask = sum(1 << i for i in playing if counts[i] == lowest)
+        highest_mask = sum(1 << i for i in playing if counts[i] == highest)
 
-        return fair_lineups
+        #
+        # Determine which lineups are 'fair' for this inning.
+        # The fewest played only goes up if every one of those players is on the field,
+        # and the most played only goes up if any one of those players is on the field.
+        # So depending on how far apart they are now, the fewest played must play
+        # and/or the most played must sit.
+        #
+        spread = highest - lowest
+
+        if spread < self.fairness:
+            fair = index.all(count)
+        elif spread == self.fairness:
+            fair = index.including(lowest_mask, count) | index.excluding(highest_mask, count)
+        elif spread == self.fairness + 1:
+            fair = index.including(lowest_mask, count) & index.excluding(highest_mask, count)
+        else:
+            fair = index.all(0)
+
+        return fair
     
-    @cache
-    def _minimum_viable_score(self, strengths: frozenset, current_depth):
+    def _minimum_viable_score(self, count: int, total: int, squares: int, current_depth, goal: float):
+        """
+        Lowest strength for the next inning that can still beat the goal score, given the
+        count, tenths sum and squared tenths sum of the strengths so far.
+        """
+        key = (count, total, squares, current_depth, goal)
+        ideal = self.minimum_viable_score_cache.get(key)
+        if ideal is not None:
+            return ideal
   
         start_time = time.time()
 
-        goal = self.best_score
-        lower_bound = self.min_lineup.strength
-        upper_bound = self.max_lineup.strength
+        lower_bound = self.min_strength
+        upper_bound = self.max_strength
         max_depth = self.config.number_innings
 
         remaining = max_depth - current_depth
 
-        strengths = list(strengths)
-        mean = statistics.mean(strengths)
-        maximize_strengths: List[float] = strengths + [upper_bound]*(remaining-1)
-        minimize_stddev: List[float] = strengths + [mean]*(remaining - 1)
-
-        sum_strength = sum(maximize_strengths)
-        sum_std = sum(minimize_stddev)
-        sum_std2 = sum(x*x for x in minimize_stddev)
+        # Best case, the remaining innings at the strongest lineup for the mean and at the mean so far for stddev
+        mean = total / (10 * count)
 
-        n_strength = len(maximize_strengths)
-        n_std = len(minimize_stddev)
+        # The next inning is v, so on the last one there are none to fill in
+        filled = max(remaining - 1, 0)
+        sum_strength = total / 10 + upper_bound*filled
+        sum_std = total / 10 + mean*filled
+        sum_std2 = squares / 100 + mean*mean*filled
 
+        n = count + max(remaining, 1)
         weight = self.sigma_weight
 
+        def objective(v: float) -> float:
+            mean = (sum_strength + v) / n
+            inv_n = 1/n
+            variance = (sum_std2 + v*v)*inv_n - ((sum_std + v)*inv_n)**2
+            return mean - math.sqrt(max(variance, 0))*weight
+
+        #
+        # Candidates are the half points from the weakest to the strongest lineup.  The objective
+        # is the mean, linear in v, minus the stddev, the root of a convex quadratic in v,
+        # so it's concave.  It rises to a single peak then falls, so the lowest candidate
+        # beating the goal is found by bisecting the rising side.
+        #
         start = int(lower_bound * 2)
         end = int(upper_bound * 2)
 
-        ideal = upper_bound + 1
-
-        for i in range(start, end + 1):
-            v = i * 0.5
-
-            mean = (sum_strength + v) / (n_strength + 1)
-
-            new_sum = sum_std + v
-            new_sum2 = sum_std2 + v*v
-            n = n_std + 1
-            inv_n = 1/n
+        #
+        # The peak is where the stddev grows as fast as the mean.  With s = sum_std2 and
+        # c = sum_std that's where (n - 1)v - c = u, u = sqrt(n(s - c²/(n - 1)) / (weight² - 1/(n - 1))).
+        # Below weight² = 1/(n - 1) the objective never stops rising.
+        #
+        peak = end
+        if n > 1 and weight*weight > 1/(n - 1):
+            spread = max(n*(sum_std2 - sum_std*sum_std/(n - 1)), 0)
+            u = math.sqrt(spread / (weight*weight - 1/(n - 1)))
+            peak = int(clamp(math.floor(2*(sum_std + u)/(n - 1)), start, end))
 
-            variance = new_sum2*inv_n - (new_sum*inv_n)**2
-            stddev = math.sqrt(variance)
+        # The best candidate is next to the peak, check either side for float error
+        candidates = range(max(peak - 1, start), min(peak + 2, end + 1))
+        peak = max(candidates, key=lambda i: (objective(i * 0.5), -i))
 
-            if mean - stddev*weight > goal:
-                ideal = v
-                break
+        ideal = upper_bound + 1
+        if objective(peak * 0.5) > goal:
+            low, high = start, peak
+            while low < high:
+                middle = (low + high) // 2
+                if objective(middle * 0.5) > goal:
+                    high = middle
+                else:
+                    low = middle + 1
+            ideal = low * 0.5
+
+        self.minimum_viable_score_cache.put(key, ideal)
 
         add_time("minimum_viable_score", start_time)
         return ideal
@@ -295,3 +997,16 @@ class BeamScheduler:
             
 
 
+#
+# Parallel search workers, each process builds its own scheduler once and searches a branch per task
+#
+_branch_scheduler: BeamScheduler = None
+
+def _start_branch_worker(players: List[Player], config: ScheduleConfig, incumbent: Any,
+                         deadline: Optional[float], cancellation_token: Optional[CancellationToken]):
+    global _branch_scheduler
+    _branch_scheduler = BeamScheduler(players, config, lambda increment, msg: None, deadline, cancellation_token)
+    _branch_scheduler.incumbent = incumbent
+
+def _search_branch(lineup: int, percentiles: List[float], kept: int):
+    return _branch_scheduler.search_branch(lineup, percentiles, kept)
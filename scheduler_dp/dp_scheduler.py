@@ -2,11 +2,14 @@
 
 from math import sqrt
 import time
-from typing import Dict, List
+from typing import List
 
-from services.inning_service import get_all_possible_innings
+import numpy as np
+
+from scheduler.lineup_index import LineupIndex
+from services.inning_service import build_inning, get_all_possible_innings, get_lineup_strengths, get_player_masks, get_strongest_lineups
 from services.player_service import get_early_players, get_late_players
-from softball_models.inning import Inning
+from softball_models.lineup_table import LineupTable
 from softball_models.player import Player
 from softball_models.schedule import Schedule
 from softball_models.schedule_config import ScheduleConfig
@@ -26,36 +29,22 @@ class DPScheduler:
         self.early_players: List[Player] = get_early_players(players)
         self.all_players = self.early_players + self.late_players
 
-        self.late_lineups: List[Inning] = get_all_possible_innings(self.all_players, config.females_required)
-        self.early_lineups: List[Inning] = get_all_possible_innings(self.early_players, config.females_required)[:1000]
+        # Early lineups first, the all players enumeration reuses them
+        early_lineups = get_all_possible_innings(self.early_players, config.females_required, workers=config.enumeration_workers, gray_code=config.enumeration_gray_code)
+        self.late_lineups: LineupTable = get_all_possible_innings(self.all_players, config.females_required, workers=config.enumeration_workers, gray_code=config.enumeration_gray_code)
+        self.early_lineups: LineupTable = get_strongest_lineups(early_lineups, 1000)
 
-        self.early_index = {p.id: i for i, p in enumerate(self.early_players)}
-        self.late_index = {p.id: i for i, p in enumerate(self.all_players)}
+        self.early_strengths: List[float] = get_lineup_strengths(self.early_lineups).tolist()
 
-        self.early_lineup_vectors = self._get_lineup_vectors(len(self.early_players), self.early_index, self.early_lineups)
-        self.late_lineup_vectors = self._get_lineup_vectors(len(self.all_players), self.late_index, self.late_lineups)
+        self.early_index = LineupIndex(get_player_masks(self.early_lineups, self.early_players).tolist(),
+                                       self.early_strengths, len(self.early_players))
 
-        self.min_lineup: Inning = self.late_lineups[-1]
-        self.max_lineup: Inning = self.late_lineups[0]
+        late_strengths = get_lineup_strengths(self.late_lineups)
+        self.min_strength: float = late_strengths[-1]
+        self.max_strength: float = late_strengths[0]
 
         self.best_score: float = 0
 
-    def _get_lineup_vectors(self, 
-                            num_players: int, 
-                            player_index: Dict[int, int], 
-                            lineups: List[Inning]):
-        
-        lineup_vectors = []
-        for lineup in lineups:
-            vec = [0] * num_players
-            for p in lineup.playing_ids:
-                idx = player_index[p]   # map player -> index
-                vec[idx] = 1
-
-            lineup_vectors.append(vec)
-
-        return lineup_vectors
-
     @staticmethod
     def create(players: List[Player], config: ScheduleConfig):
         scheduler = DPScheduler(players, config)
@@ -78,6 +67,11 @@ class DPScheduler:
         fairness = self.config.fair_factor
         innings = self.config.number_innings
 
+        strengths = np.array(self.early_strengths)
+        batchsize = 100
+        num_batches = (num_lineups + batchsize - 1) // batchsize
+        block_size = 256
+
         zero_exposure = tuple([0] * num_players)
 
         dp[zero_exposure] = (0.0, 0.0, None, None)
@@ -92,56 +86,47 @@ class DPScheduler:
             start = time.time()
             next_dp = {}
 
-            for exposure, state in dp.items():
-
-                sum_strength, sum_strength2, prev_exp, prev_lineup = state
-
-
-                batchsize = 100
-                start = 0 - batchsize
-                end = 0
-
-                while end < num_lineups:
-
-                    start += batchsize
-                    end = min(start + batchsize, num_lineups)
+            exposures = list(dp.keys())
+            states = list(dp.values())
 
-                    for lineup, vec in zip(self.early_lineups[start:end], self.early_lineup_vectors[start:end]):
-                        count += 1
-                        # copy exposure
-                        new_exp = list(exposure)
+            # fairness is checked for a block of exposures against every lineup at once
+            for block in range(0, len(exposures), block_size):
+                block_exposures = np.array(exposures[block:block + block_size])
+                block_sums = np.array([state[:2] for state in states[block:block + block_size]])
 
-                        # update exposure counts
-                        for i in range(num_players):
-                            if vec[i]:
-                                new_exp[i] += 1
+                # fairness constraint
+                fair = self.early_index.is_fair(block_exposures, fairness)
 
-                        # fairness constraint
-                        if max(new_exp) - min(new_exp) > fairness:
-                            break
+                # each batch of lineups is only taken up to its first unfair lineup
+                unfair = np.ones((len(fair), num_batches * batchsize), dtype=bool)
+                unfair[:, :num_lineups] = ~fair
+                taken = ~np.logical_or.accumulate(unfair.reshape(len(fair), num_batches, batchsize), axis=2)
+                rows, lineups = np.nonzero(taken.reshape(len(fair), -1)[:, :num_lineups])
+                count += len(lineups)
 
-                        # print(depth, new_exp, count)
+                # update exposure counts and strength sums
+                new_exps = (block_exposures[rows] + self.early_index.incidence[:, lineups].T).tolist()
+                new_sums = (block_sums[rows, 0] + strengths[lineups]).tolist()
+                new_sums2 = (block_sums[rows, 1] + strengths[lineups] ** 2).tolist()
 
-                        new_exp = tuple(new_exp)
+                for row, lineup, new_exp, new_sum, new_sum2 in zip(rows.tolist(), lineups.tolist(), new_exps, new_sums, new_sums2):
 
-                        new_sum = sum_strength + lineup.strength
-                        new_sum2 = sum_strength2 + lineup.strength ** 2
+                    new_exp = tuple(new_exp)
 
-                        # keep only the best score for this exposure
-                        if new_exp in next_dp:
+                    # keep only the best score for this exposure
+                    if new_exp in next_dp:
 
-                            old_sum, _, _, _ = next_dp[new_exp]
+                        old_sum, _, _, _ = next_dp[new_exp]
 
-                            if new_sum <= old_sum:
-                                continue
+                        if new_sum <= old_sum:
+                            continue
 
-                        next_dp[new_exp] = (
-                            new_sum,
-                            new_sum2,
-                            exposure,
-                            lineup
-                        )
-                    
+                    next_dp[new_exp] = (
+                        new_sum,
+                        new_sum2,
+                        exposures[block + row],
+                        lineup
+                    )
 
             print("number of unique exposures", len(next_dp))
             dp = next_dp
@@ -180,7 +165,7 @@ class DPScheduler:
             if lineup is None:
                 break
 
-            schedule.append(lineup)
+            schedule.append(build_inning(self.early_lineups, lineup))
             cur = prev_exp
 
         schedule.reverse()
@@ -0,0 +1,219 @@
+from functools import cache
+from math import comb
+from typing import Iterator
+
+import numpy as np
+
+#
+# Revolving door (Gray code) enumeration of player subsets.  Consecutive subsets differ by
+# one player swap, so instead of solving every subset's position assignment from scratch,
+# the previous optimal assignment is repaired with a single augmenting path.
+#
+# Subsets are walked as many short runs side by side, so each repair step is a handful of
+# NumPy operations across every run at once.
+#
+
+# Consecutive subsets per run
+WALK_LENGTH = 64
+
+# Runs solved side by side
+WALKS = 1024
+
+@cache
+def _comb_table(n: int) -> np.ndarray:
+    return np.array([[comb(m, k) for k in range(n + 1)] for m in range(n + 2)], dtype=np.int64)
+
+def unrank_revolving_door(ranks: np.ndarray, n: int, r: int) -> np.ndarray:
+    """
+    The subsets at the given positions in revolving door order, as sorted indexes.
+
+    The order of r-subsets of range(n) is the order of r-subsets of range(n - 1),
+    followed by the (r - 1)-subsets of range(n - 1) in reverse, each with n - 1 added.
+    """
+    table = _comb_table(n)
+
+    ranks = np.asarray(ranks, dtype=np.int64)
+    remaining = np.full(len(ranks), r, dtype=np.int64)
+    members = np.zeros((len(ranks), n), dtype=bool)
+
+    for m in range(n - 1, -1, -1):
+        member = ranks >= table[m, remaining]
+        ranks = np.where(member, table[m + 1, remaining] - 1 - ranks, ranks)
+        remaining -= member
+        members[:, m] = member
+
+    return np.nonzero(members)[1].reshape(len(ranks), r)
+
+def walk_chunks(females: np.ndarray, r: int, min_females: int, start: int, stop: int) -> Iterator[tuple]:
+    """
+    Yields the subsets of r players with at least min_females females, [start:stop) of them,
+    as (walks, steps) where walks is a (runs, WALK_LENGTH, r) array of sorted player indexes
+    and steps marks the real subsets.  Short runs are padded by repeating their last subset.
+
+    Like the lexicographic enumeration there's one block per number of females k.  Block k
+    walks the k-female combinations, and for each of them every (r - k)-male combination,
+    forwards and backwards in turn, so each step swaps a single player.
+    """
+    female_players = np.flatnonzero(females)
+    male_players = np.flatnonzero(~females)
+    num_females, num_males = len(female_players), len(male_players)
+
+    block_start = 0
+    for k in range(max(min_females, 0), min(num_females, r) + 1):
+        male_combinations = comb(num_males, r - k)
+        block_stop = block_start + comb(num_females, k) * male_combinations
+        if block_stop == block_start:
+            continue
+
+        #
+        # Runs start at multiples of WALK_LENGTH into the block, whatever the range, so
+        # every subset is solved the same way however the enumeration is split up.
+        #
+        first = block_start + (max(start, block_start) - block_start) // WALK_LENGTH * WALK_LENGTH
+        last = min(stop, block_stop)
+
+        for chunk_start in range(first, last, WALKS * WALK_LENGTH):
+            chunk_stop = min(chunk_start + WALKS * WALK_LENGTH, block_stop)
+
+            # Runs of WALK_LENGTH ranks, the last one padded with its last rank
+            num_walks = (min(chunk_stop, last) - chunk_start + WALK_LENGTH - 1) // WALK_LENGTH
+            ranks = chunk_start + np.arange(num_walks * WALK_LENGTH, dtype=np.int64)
+            steps = (ranks >= start) & (ranks < last)
+            ranks = np.minimum(ranks, chunk_stop - 1) - block_start
+
+            female_ranks = ranks // male_combinations
+            male_ranks = ranks % male_combinations
+            male_ranks = np.where(female_ranks % 2, male_combinations - 1 - male_ranks, male_ranks)
+
+            subsets = np.concatenate([
+                female_players[unrank_revolving_door(female_ranks, num_females, k)],
+                male_players[unrank_revolving_door(male_ranks, num_males, r - k)],
+            ], axis=1)
+            subsets.sort(axis=1)
+
+            yield subsets.reshape(num_walks, WALK_LENGTH, r), steps.reshape(num_walks, WALK_LENGTH)
+
+        block_start = block_stop
+
+def solve_walks(strength_matrix: np.ndarray, walks: np.ndarray) -> np.ndarray:
+    """
+    Solves the player -> position assignment of every subset in the runs.
+
+    Args:
+        strength_matrix: (players, positions) weighted strengths.
+        walks: (runs, steps, positions) sorted player indexes, consecutive subsets in a run differ by one player.
+
+    Returns:
+        (runs, steps, positions) array, the position index of each subset player.
+    """
+    num_walks, num_steps, r = walks.shape
+    runs = np.arange(num_walks)
+
+    #
+    # Minimum cost assignment state, positions x runs so the per run reductions are contiguous.
+    # Slots hold the subset players in whatever order they arrived.
+    #
+    costs = np.ascontiguousarray(-strength_matrix.T)
+    players = walks[:, 0].T.copy()  # player in each slot
+    slot_at = np.full((r, num_walks), -1, dtype=np.intp)  # slot at each position, -1 when open
+    position_of = np.full((r, num_walks), -1, dtype=np.intp)  # position of each slot
+    u = np.zeros((r, num_walks))  # slot potentials
+    v = np.zeros((r, num_walks))  # position potentials
+
+    # First subset of each run from scratch, one slot at a time
+    for slot in range(r):
+        _augment(costs, players, slot_at, position_of, u, v, np.full(num_walks, slot))
+
+    # Players leaving and joining at each step, runs padded with a repeat swap a player for itself
+    members = np.zeros((num_walks, num_steps, strength_matrix.shape[0]), dtype=bool)
+    np.put_along_axis(members, walks, True, axis=2)
+    leaving = (members[:, :-1] & ~members[:, 1:]).argmax(axis=2).T
+    joining = (members[:, 1:] & ~members[:, :-1]).argmax(axis=2).T
+    changed = (members[:, :-1] != members[:, 1:]).any(axis=2).T
+
+    slot_players = np.empty((num_steps, r, num_walks), dtype=np.intp)
+    slot_positions = np.empty((num_steps, r, num_walks), dtype=np.intp)
+    slot_players[0] = players
+    slot_positions[0] = position_of
+
+    for step in range(1, num_steps):
+        slot = np.where(changed[step - 1], (players == leaving[step - 1]).argmax(axis=0), 0)
+        player = np.where(changed[step - 1], joining[step - 1], players[slot, runs])
+
+        # Open up the leaving player's position and put the joining player on it
+        slot_at[position_of[slot, runs], runs] = -1
+        position_of[slot, runs] = -1
+        players[slot, runs] = player
+        _augment(costs, players, slot_at, position_of, u, v, slot)
+
+        slot_players[step] = players
+        slot_positions[step] = position_of
+
+    # Back to sorted subset order
+    slot_players = slot_players.transpose(2, 0, 1)
+    slot_positions = slot_positions.transpose(2, 0, 1)
+    return np.take_along_axis(slot_positions, np.argsort(slot_players, axis=2), axis=2)
+
+def _augment(costs: np.ndarray, players: np.ndarray, slot_at: np.ndarray, position_of: np.ndarray,
+             u: np.ndarray, v: np.ndarray, slot: np.ndarray):
+    """
+    Assigns slot, in every run, along the shortest augmenting path to an open position.
+    The other slots are already assigned optimally and the potentials are feasible,
+    so the result is an optimal assignment again.
+    """
+    r, num_walks = players.shape
+    runs = np.arange(num_walks)
+
+    reduced = costs[:, players[slot, runs]] - v
+    u[slot, runs] = reduced.min(axis=0)
+
+    # Dijkstra over positions on the reduced costs
+    dist = reduced - u[slot, runs]
+    label = np.zeros((r, num_walks))
+    scanned = np.zeros((r, num_walks), dtype=bool)
+    prev_slot = np.broadcast_to(slot, (r, num_walks)).copy()
+    end = np.zeros(num_walks, dtype=np.intp)
+    length = np.zeros(num_walks)
+    searching = np.ones(num_walks, dtype=bool)
+
+    while True:
+        closest = dist.argmin(axis=0)
+        delta = dist[closest, runs]
+        next_slot = slot_at[closest, runs]
+
+        label[closest[searching], runs[searching]] = delta[searching]
+        scanned[closest[searching], runs[searching]] = True
+        dist[closest[searching], runs[searching]] = np.inf
+
+        found = searching & (next_slot < 0)
+        end[found] = closest[found]
+        length[found] = delta[found]
+        searching &= ~found
+        if not searching.any():
+            break
+
+        # Finished runs stop relaxing
+        delta[~searching] = np.inf
+        next_slot[~searching] = 0
+
+        through = costs[:, players[next_slot, runs]] + (delta - u[next_slot, runs]) - v
+        through[scanned] = np.inf
+        np.copyto(prev_slot, next_slot, where=through < dist)
+        np.minimum(dist, through, out=dist)
+
+    v += np.where(scanned, label - length, 0)
+
+    # Shift every slot on the path to its new position
+    position = end
+    shifting = np.ones(num_walks, dtype=bool)
+    while shifting.any():
+        moving = prev_slot[position, runs]
+        next_position = position_of[moving, runs]
+
+        slot_at[position[shifting], runs[shifting]] = moving[shifting]
+        position_of[moving[shifting], runs[shifting]] = position[shifting]
+
+        shifting &= moving != slot
+        position = np.where(shifting, next_position, position)
+
+    u[:] = costs[position_of, players] - np.take_along_axis(v, position_of, axis=0)
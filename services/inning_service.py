@@ -1,79 +1,577 @@
 
 
+from concurrent.futures import ProcessPoolExecutor
 from functools import cache
-from typing import List
+import heapq
+from itertools import repeat
+from math import comb
+from typing import Dict, Iterator, List
 
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+from services import gray_code_service
+from services.lineup_cache_service import get_lineup_dtype, get_player_key, get_roster_key, load_lineups, save_lineups, sort_roster
 from services.position_service import get_positions
 from softball_models.inning import Inning
+from softball_models.lineup_table import LineupTable
 from softball_models.player import Player
+from softball_models.positions import Position
+
+# Weighted strength used when a player can't play a position
+INVALID_STRENGTH = -1e9
+
+# Number of player subsets evaluated per batch
+CHUNK_SIZE = 8192
+
+# Parallel enumeration splits the combinations into this many rank ranges per worker
+RANGES_PER_WORKER = 4
+
+# Rosters with fewer combinations than this aren't worth starting a process pool for
+PARALLEL_MIN_COMBINATIONS = 50_000
+
+#
+# Every roster enumerated in this process, by positions and min_females.  A subset's position
+# assignment doesn't depend on who else is on the roster, so when a roster contains one of these
+# (the early players of a roster with late arrivals) their lineups are reused instead of solved again.
+#
+_enumerated_rosters: Dict[tuple, List[LineupTable]] = {}
+
+def get_all_possible_innings(available_players: List[Player], min_females: int, top_k: int = None, min_strength: float = None, workers: int = 1, gray_code: bool = False):
+    """
+    Creates every lineup of the available players with at least min_females on the field.
 
-def get_all_possible_innings(available_players: List[Player], min_females: int):
-    return _get_all_possible_innings(frozenset(available_players), min_females)
+    Args:
+        available_players: The players that can be put on the field.
+        min_females: Lineups with fewer females playing are skipped.
+        top_k: If given, only the top_k strongest lineups are returned.
+        min_strength: If given, only lineups at least this strong are returned.
+        workers: Number of processes used to enumerate every lineup.  Results are the same for any number.
+        gray_code: Enumerate every lineup in revolving door order, repairing each position assignment
+                   from the previous lineup's instead of solving it from scratch.  Strengths are the same,
+                   equally strong position assignments may be picked differently.
+
+    Returns:
+        A LineupTable sorted strongest first.  Lineups of equal strength keep their enumeration order.
+    """
+    if top_k is None and min_strength is None:
+        return _get_all_possible_innings(frozenset(available_players), min_females, workers, gray_code)
+
+    return _get_best_possible_innings(frozenset(available_players), min_females, top_k, min_strength)
 
 @cache
-def _get_all_possible_innings(available_players: frozenset, min_females: int):
+def _get_all_possible_innings(available_players: frozenset, min_females: int, workers: int, gray_code: bool):
+
+    available_players = sort_roster(available_players)
+
+    positions = get_positions(len(available_players), allow_not_enough=True)
+
+    #
+    # Enumerating is expensive, so lineups are cached on disk by the roster's attributes
+    # and shared with other processes.
+    #
+    key = get_roster_key(available_players, positions, min_females, gray_code)
+    lineups = load_lineups(key)
+
+    if lineups is None:
+        # Gray code walks step through every subset anyway, and how ties are broken depends on the walk
+        known = None if gray_code else _find_enumerated_roster(available_players, positions, min_females)
+        lineups = _enumerate_lineups(available_players, positions, min_females, workers, known, gray_code)
+        save_lineups(key, lineups)
 
-    from itertools import combinations
-    import numpy as np
-    from scipy.optimize import linear_sum_assignment
+    table = _to_table(lineups, available_players, positions)
+    if not gray_code:
+        _enumerated_rosters.setdefault(_get_enumeration_key(positions, min_females), []).append(table)
 
-    available_players = list(available_players)
+    return table
+
+def _get_enumeration_key(positions: List[Position], min_females: int) -> tuple:
+    return (tuple((pos.name, float(pos.weight)) for pos in positions), min_females)
+
+def _find_enumerated_roster(available_players: List[Player], positions: List[Position], min_females: int) -> LineupTable | None:
+    """
+    The largest roster already enumerated with the same positions and min_females
+    whose players are all in available_players, None if there isn't one.
+    """
+    player_keys = {p.id: get_player_key(p) for p in available_players}
+
+    best = None
+    for table in _enumerated_rosters.get(_get_enumeration_key(positions, min_females), []):
+        if len(table.players) >= len(available_players):
+            continue
+        if best is not None and len(table.players) <= len(best.players):
+            continue
+        if all(player_keys.get(p.id) == get_player_key(p) for p in table.players):
+            best = table
+
+    return best
+
+@cache
+def _get_best_possible_innings(available_players: frozenset, min_females: int, top_k: int, min_strength: float):
+
+    available_players = sort_roster(available_players)
 
     positions = get_positions(len(available_players), allow_not_enough=True)
 
+    strength_matrix = get_strength_matrix(available_players, positions)
+    females = np.array([p.female for p in available_players], dtype=bool)
+
+    max_score = sum(10 * pos.weight for pos in positions)
+
+    search = _BoundedLineupSearch(strength_matrix, females, min_females, max_score, top_k, min_strength)
+    search.run()
+    print("Total combinations", search.count, "of", comb(len(available_players), len(positions)))
+
+    lineups = _to_lineups(*search.best(), len(positions))
+    return _to_table(lineups, available_players, positions)
+
+def _enumerate_lineups(available_players: List[Player], positions: List[Position], min_females: int, workers: int = 1, known: LineupTable = None, gray_code: bool = False) -> np.ndarray:
+    """
+    Every lineup with at least min_females playing, strongest first.
+
+    known: Lineups of some of the available players, enumerated with the same positions and min_females.
+           Subsets of only those players are copied from it instead of solved again.
+    gray_code: Solve subsets in revolving door order, see gray_code_service.
+    """
     num_positions = len(positions)
     num_players = len(available_players)
 
-    lineups = []
+    if not num_positions:
+        return np.empty(0, dtype=get_lineup_dtype(num_positions))
 
     max_score = sum(10 * pos.weight for pos in positions)
 
-    count = 0
-    # Try only valid player subsets of correct size and enough females
-    for subset in combinations(available_players, r=num_positions):
-        count += 1
-        if sum(p.female for p in subset) < min_females:
-            continue
+    #
+    # Build the player x position weighted strength matrix once for the whole roster.
+    # Each subset's score matrix is then just a fancy-indexed slice of it.
+    #
+    strength_matrix = get_strength_matrix(available_players, positions)
+    females = np.array([p.female for p in available_players], dtype=bool)
+
+    # Players whose subsets are all in the known lineups
+    skip = None
+    if known is not None:
+        known_ids = {p.id for p in known.players}
+        skip = np.array([p.id in known_ids for p in available_players], dtype=bool)
+
+    num_females = int(females.sum())
+    total = sum(size for _, size in _feasible_blocks(num_females, num_players - num_females, num_positions, min_females))
+    print("Total combinations", total, "of", comb(num_players, num_positions))
+
+    #
+    # Feasible subsets are split into contiguous ranges.  Results come back in range
+    # order, so the lineups are the same as evaluating every range in this process.
+    #
+    if workers > 1 and total >= PARALLEL_MIN_COMBINATIONS:
+        bounds = np.linspace(0, total, workers * RANGES_PER_WORKER + 1).astype(np.int64).tolist()
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_evaluate_range, repeat(strength_matrix), repeat(females), repeat(min_females), bounds[:-1], bounds[1:], repeat(skip), repeat(gray_code)))
+    else:
+        results = [_evaluate_range(strength_matrix, females, min_females, 0, total, skip, gray_code)]
+
+    subsets = np.concatenate([subsets for subsets, _, _ in results])
+    assignments = np.concatenate([assignments for _, assignments, _ in results])
+    scores = np.concatenate([scores for _, _, scores in results])
+
+    strengths = np.round(100*scores / max_score, 1)
+    lineups = _to_lineups(strengths, subsets, assignments, num_positions)
+
+    if known is not None:
+        lineups = np.concatenate([lineups, _reindex_lineups(known, available_players)])
+
+    # Lineups of equal strength are kept in combinations() order
+    strengths = np.round(lineups["strength"].astype(np.float64), 1)
+    ranks = _lex_ranks(np.sort(lineups["positions"], axis=1), num_players)
+    order = np.lexsort((ranks, -strengths))
+
+    return lineups[order]
+
+def _reindex_lineups(lineups: LineupTable, available_players: List[Player]) -> np.ndarray:
+    """
+    Packs the lineups of a table with player indexes into available_players.
+    """
+    index = {p.id: i for i, p in enumerate(available_players)}
+    mapping = np.array([index[p.id] for p in lineups.players], dtype=np.intp)
+
+    # The field is already in position order, so every player keeps their position index
+    field = mapping[lineups.field]
+    assignments = np.broadcast_to(np.arange(field.shape[1]), field.shape)
+
+    return _to_lineups(lineups.strength, field, assignments, field.shape[1])
+
+def _evaluate_range(strength_matrix: np.ndarray, females: np.ndarray, min_females: int, start: int, stop: int, skip: np.ndarray = None, gray_code: bool = False):
+    """
+    Solves the feasible subsets [start, stop), numbered as in _feasible_chunks,
+    or as in gray_code_service.walk_chunks when gray_code is set.
+    Subsets of only skip players are left out, skip isn't supported with gray_code.
+
+    Returns:
+        (subsets, assignments, scores) in enumeration order.
+    """
+    num_players, num_positions = strength_matrix.shape
+
+    subsets = [np.empty((0, num_positions), dtype=np.intp)]
+    assignments = [np.empty((0, num_positions), dtype=np.intp)]
+    scores = [np.empty(0)]
+
+    if gray_code:
+        solved = _solve_walk_chunks(strength_matrix, females, min_females, start, stop)
+    else:
+        solved = _solve_feasible_chunks(strength_matrix, females, min_females, start, stop, skip)
+
+    for chunk, chunk_assignments in solved:
+        # A person playing out of position essentially counts as 0
+        matched_scores = strength_matrix[chunk, chunk_assignments]
+        chunk_scores = np.where(matched_scores >= 0, matched_scores, 0).sum(axis=1)
+
+        subsets.append(chunk)
+        assignments.append(chunk_assignments)
+        scores.append(chunk_scores)
+
+    return np.concatenate(subsets), np.concatenate(assignments), np.concatenate(scores)
+
+def _solve_feasible_chunks(strength_matrix: np.ndarray, females: np.ndarray, min_females: int, start: int, stop: int, skip: np.ndarray = None):
+    num_positions = strength_matrix.shape[1]
+
+    for chunk in _feasible_chunks(females, num_positions, min_females, start, stop):
+        if skip is not None:
+            chunk = chunk[~skip[chunk].all(axis=1)]
+
+        chunk_assignments, _ = _assign_positions(strength_matrix[chunk])
+        yield chunk, chunk_assignments
+
+def _solve_walk_chunks(strength_matrix: np.ndarray, females: np.ndarray, min_females: int, start: int, stop: int):
+    num_positions = strength_matrix.shape[1]
+
+    for walks, steps in gray_code_service.walk_chunks(females, num_positions, min_females, start, stop):
+        walk_assignments = gray_code_service.solve_walks(strength_matrix, walks)
+        yield walks[steps], walk_assignments[steps]
+
+def get_strength_matrix(players: List[Player], positions: List[Position]) -> np.ndarray:
+    """
+    Weighted strength of every player at every position.
+
+    Returns:
+        A (num players, num positions) float matrix, INVALID_STRENGTH where the
+        player can't play the position.
+    """
+    strength_matrix = np.full((len(players), len(positions)), INVALID_STRENGTH)
+
+    for i, player in enumerate(players):
+        for j, pos in enumerate(positions):
+            if pos in player.positions:
+                strength = player.positions_stengths.get(pos, 0)
+                strength_matrix[i][j] = strength * pos.weight
+
+    return strength_matrix
+
+def _feasible_blocks(num_females: int, num_males: int, r: int, min_females: int) -> Iterator[tuple]:
+    """
+    Yields (k, number of subsets) for every number of females k a feasible subset of r players can have.
+    """
+    for k in range(max(min_females, 0), min(num_females, r) + 1):
+        size = comb(num_females, k) * comb(num_males, r - k)
+        if size:
+            yield k, size
+
+def _feasible_chunks(females: np.ndarray, r: int, min_females: int, start: int, stop: int, chunk_size: int = CHUNK_SIZE) -> Iterator[np.ndarray]:
+    """
+    Yields the subsets of r players with at least min_females females, [start:stop) of them,
+    as (chunk_size, r) arrays of sorted player indexes.
+
+    Only feasible subsets are generated.  They're numbered in one block per number of
+    females k, and block k is every combination of k females with every combination of r - k males.
+    """
+    female_players = np.flatnonzero(females)
+    male_players = np.flatnonzero(~females)
+
+    block_start = 0
+    for k, size in _feasible_blocks(len(female_players), len(male_players), r, min_females):
+        block_stop = block_start + size
+        male_combinations = comb(len(male_players), r - k)
+
+        for chunk_start in range(max(start, block_start), min(stop, block_stop), chunk_size):
+            ranks = np.arange(chunk_start, min(chunk_start + chunk_size, stop, block_stop), dtype=np.int64) - block_start
+
+            subsets = np.concatenate([
+                female_players[_unrank(ranks // male_combinations, len(female_players), k)],
+                male_players[_unrank(ranks % male_combinations, len(male_players), r - k)],
+            ], axis=1)
+            yield np.sort(subsets, axis=1)
+
+        block_start = block_stop
+
+def _assign_positions(score_matrices: np.ndarray):
+    """
+    Solves the player -> position assignment for a batch of square score matrices.
+
+    Args:
+        score_matrices: (batch, subset player, position) weighted strengths.
+
+    Returns:
+        (assignments, scores) where assignments[b][i] is the position index of the
+        i'th subset player and scores[b] is the sum of the valid matched strengths.
+        A person playing out of position essentially counts as 0.
+    """
+    batch, num_positions, _ = score_matrices.shape
+    assignments = np.empty((batch, num_positions), dtype=np.intp)
+
+    for b in range(batch):
+        _, assignments[b] = linear_sum_assignment(-score_matrices[b])
+
+    matched_scores = np.take_along_axis(score_matrices, assignments[:, :, None], axis=2)[:, :, 0]
+    scores = np.where(matched_scores >= 0, matched_scores, 0).sum(axis=1)
+
+    return assignments, scores
+
+@cache
+def _rank_table(n: int, r: int) -> np.ndarray:
+    return np.array([[comb(n - 1 - c, r - i) for c in range(n)] for i in range(r)], dtype=np.int64).reshape(r, n)
+
+def _lex_ranks(subsets: np.ndarray, n: int) -> np.ndarray:
+    """
+    Position of each sorted subset in combinations(range(n), r) order.
+    """
+    r = subsets.shape[1]
+    table = _rank_table(n, r)
+    return comb(n, r) - 1 - table[np.arange(r), subsets].sum(axis=1)
+
+def _unrank(ranks: np.ndarray, n: int, r: int) -> np.ndarray:
+    """
+    The subsets at the given positions in combinations(range(n), r) order, the inverse of _lex_ranks.
+    """
+    # Greedily decompose the reversed rank into sum(comb(n - 1 - subset[i], r - i))
+    remainder = comb(n, r) - 1 - ranks
+    table = _rank_table(n, r)[:, ::-1]
+
+    subsets = np.empty((len(ranks), r), dtype=np.intp)
+    for i in range(r):
+        d = np.searchsorted(table[i], remainder, side="right") - 1
+        remainder = remainder - table[i][d]
+        subsets[:, i] = n - 1 - d
+
+    return subsets
+
+class _BoundedLineupSearch:
+    """
+    Branch and bound over combinations(players, r=num_positions) that keeps only the
+    top_k strongest lineups (or those at least min_strength strong).
+
+    A partial subset can be completed with any of the players after its last player.
+    No completion can score more than every position taking the best weighted strength
+    among the partial subset and those remaining players, so whole branches under the
+    current k'th best are skipped.  Players are searched strongest first, which finds
+    strong lineups early and makes the remaining players weaker as the search goes on.
+    """
+
+    # Leaves are solved in batches of this size, the k'th best only moves between batches
+    batch_size = 1024
+
+    def __init__(self, strength_matrix: np.ndarray, females: np.ndarray, min_females: int, max_score: float, top_k: int, min_strength: float):
+        num_players, num_positions = strength_matrix.shape
+
+        self.strength_matrix = strength_matrix
+        self.num_players = num_players
+        self.num_positions = num_positions
+        self.min_females = min_females
+        self.max_score = max_score
+        self.top_k = top_k if top_k is not None else float("inf")
+        self.min_strength = min_strength if min_strength is not None else float("-inf")
+
+        # Search order -> roster index, strongest players first
+        valid = np.maximum(strength_matrix, 0)
+        self.order = np.argsort(-valid.max(axis=1, initial=0), kind="stable")
+        self.valid = valid[self.order]
+        self.females = females[self.order].astype(int)
+
+        # Best weighted strength at each position among the players from i onwards
+        self.remaining_best = np.zeros((num_players + 1, num_positions))
+        self.remaining_females = np.zeros(num_players + 1, dtype=int)
+        for i in range(num_players - 1, -1, -1):
+            self.remaining_best[i] = np.maximum(self.valid[i], self.remaining_best[i + 1])
+            self.remaining_females[i] = self.females[i] + self.remaining_females[i + 1]
+
+        self.heap = []
+        self.pending = []
+        self.pending_count = 0
+        self.floor = float("-inf")
+        self.count = 0
+
+    def run(self):
+        if not self.num_positions or not self.max_score:
+            return
+        self._update_floor()
+        self._search(0, [], np.zeros(self.num_positions), 0)
+        self._flush()
+
+    def best(self):
+        """
+        The kept lineups as (strengths, subsets, assignments), strongest first.
+        """
+        best = sorted(self.heap, reverse=True)
+        return ([strength for strength, _, _, _ in best],
+                [subset for _, _, subset, _ in best],
+                [assignment for _, _, _, assignment in best])
+
+    def _update_floor(self):
+        """
+        Smallest score that can still round to a strength worth keeping.
+        """
+        strength = self.min_strength
+        if len(self.heap) >= self.top_k:
+            strength = max(strength, self.heap[0][0])
+
+        # Half a rounding step below, plus some room for float error
+        self.floor = (strength - 0.05) * self.max_score / 100 - 1e-6
+
+    def _search(self, start: int, prefix: List[int], prefix_best: np.ndarray, prefix_females: int):
+        slots = self.num_positions - len(prefix)
+
+        if slots == 1:
+            self._add_leaves(start, prefix, prefix_best, prefix_females)
+            return
+
+        for i in range(start, self.num_players - slots + 1):
+
+            # Both only get worse as i increases, so stop at the first failure
+            if prefix_females + self.remaining_females[i] < self.min_females:
+                break
+
+            if np.maximum(prefix_best, self.remaining_best[i]).sum() < self.floor:
+                break
+
+            self._search(i + 1, prefix + [i], np.maximum(prefix_best, self.valid[i]), prefix_females + self.females[i])
+
+    def _add_leaves(self, start: int, prefix: List[int], prefix_best: np.ndarray, prefix_females: int):
+        last = np.arange(start, self.num_players)
+
+        bounds = np.maximum(prefix_best, self.valid[last]).sum(axis=1)
+        keep = (bounds >= self.floor) & (prefix_females + self.females[last] >= self.min_females)
+        last = last[keep]
+        if not last.size:
+            return
+
+        subsets = np.empty((len(last), self.num_positions), dtype=np.intp)
+        subsets[:, :-1] = prefix
+        subsets[:, -1] = last
+
+        self.pending.append(subsets)
+        self.pending_count += len(subsets)
+        if self.pending_count >= self.batch_size:
+            self._flush()
+
+    def _flush(self):
+        if not self.pending:
+            return
+
+        subsets = np.sort(self.order[np.concatenate(self.pending)], axis=1)
+        self.pending = []
+        self.pending_count = 0
+        self.count += len(subsets)
+
+        assignments, scores = _assign_positions(self.strength_matrix[subsets])
+        strengths = np.round(100*scores / self.max_score, 1)
+        ranks = _lex_ranks(subsets, self.num_players)
+
+        for strength, rank, subset, assignment in zip(strengths, ranks, subsets, assignments):
+            if strength < self.min_strength:
+                continue
+
+            # Ties are broken by enumeration order, same as the exhaustive search
+            item = (strength, -int(rank), subset, assignment)
+            if len(self.heap) < self.top_k:
+                heapq.heappush(self.heap, item)
+            elif item[:2] > self.heap[0][:2]:
+                heapq.heapreplace(self.heap, item)
+
+        self._update_floor()
+
+def _to_lineups(strengths, subsets, assignments, num_positions: int) -> np.ndarray:
+    """
+    Packs lineups into the array layout stored in the lineup cache.
+    """
+    lineups = np.empty(len(strengths), dtype=get_lineup_dtype(num_positions))
+    if not len(lineups):
+        return lineups
+
+    subsets = np.asarray(subsets)
+
+    lineups["strength"] = strengths
+    lineups["bitmask"] = np.bitwise_or.reduce(np.left_shift(np.uint64(1), subsets.astype(np.uint64)), axis=1)
+
+    positions = np.empty_like(subsets)
+    np.put_along_axis(positions, np.asarray(assignments), subsets, axis=1)
+    lineups["positions"] = positions
+
+    return lineups
+
+def _to_table(lineups: np.ndarray, available_players: List[Player], positions: List[Position]) -> LineupTable:
+    female_mask = sum(1 << i for i, p in enumerate(available_players) if p.female)
+
+    return LineupTable(
+        available_players,
+        positions,
+        bitmask=lineups["bitmask"],
+        strength=lineups["strength"],
+        field=lineups["positions"],
+        females_playing=np.bitwise_count(lineups["bitmask"] & np.uint64(female_mask)),
+        playing_count=np.bitwise_count(lineups["bitmask"]),
+    )
+
+def get_strongest_lineups(lineups: LineupTable, count: int) -> LineupTable:
+    """
+    The first count lineups of the table, the strongest ones.
+    """
+    return LineupTable(
+        lineups.players,
+        lineups.positions,
+        bitmask=lineups.bitmask[:count],
+        strength=lineups.strength[:count],
+        field=lineups.field[:count],
+        females_playing=lineups.females_playing[:count],
+        playing_count=lineups.playing_count[:count],
+    )
 
-        default_strength = -1e9
-        score_matrix = np.full((num_players, num_positions), default_strength) 
+def get_lineup_strengths(lineups: LineupTable) -> np.ndarray:
+    """
+    Lineup strengths as float64.  They're stored as float32, so round back to the tenths they were computed at.
+    """
+    return np.round(lineups.strength.astype(np.float64), 1)
 
-        for i, player in enumerate(subset):
-            for j, pos in enumerate(positions):
-                if pos in player.positions:
-                    strength = player.positions_stengths.get(pos, 0)
-                    weight = pos.weight
-                    score_matrix[i][j] = strength * weight
+def get_player_masks(lineups: LineupTable, players: List[Player]) -> np.ndarray:
+    """
+    Lineup bitmasks re-indexed so bit i is set when players[i] is on the field.
+    """
+    index = {p.id: i for i, p in enumerate(players)}
 
-        row_ind, col_ind = linear_sum_assignment(-score_matrix)
+    masks = np.zeros(len(lineups), dtype=np.uint64)
+    for i, player in enumerate(lineups.players):
+        playing = (lineups.bitmask >> np.uint64(i)) & np.uint64(1)
+        masks |= playing << np.uint64(index[player.id])
 
-        matched_scores = score_matrix[row_ind, col_ind]
-        valid_scores = matched_scores[matched_scores >= 0]
+    return masks
 
-        if max_score:
-            score = round(100*valid_scores.sum() / max_score, 1)
+def build_inning(lineups: LineupTable, index: int) -> Inning:
+    """
+    Creates the Inning for one lineup of the table.
+    """
+    inning = Inning()
+    inning.id = index
+    inning.strength = round(float(lineups.strength[index]), 1)
 
-        inning = Inning()
-        inning.id = len(lineups)
-        inning.strength = score
+    field = lineups.field[index]
 
-        for i, j in zip(row_ind, col_ind):
-            player = subset[i]
-            position = positions[j]
-            inning.playing_ids.add(player.id)
-            inning.field[position] = player
+    # Fill the field in roster order
+    for j in np.argsort(field):
+        player = lineups.players[field[j]]
+        inning.playing_ids.add(player.id)
+        inning.field[lineups.positions[j]] = player
 
-        for p in available_players:
-            if p.id not in inning.playing_ids:
-                inning.bench[p.name] = p
-            else:
-                inning.playing_count += 1
-            
-                if p.female:
-                    inning.females_playing += 1
+    for p in lineups.players:
+        if p.id not in inning.playing_ids:
+            inning.bench[p.name] = p
 
-        lineups.append(inning)
+    inning.playing_count = int(lineups.playing_count[index])
+    inning.females_playing = int(lineups.females_playing[index])
 
-    lineups.sort(key = lambda l: -1*l.strength)
-    print("Total combinations", count)
-    return lineups
\ No newline at end of file
+    return inning
@@ -0,0 +1,140 @@
+import hashlib
+import os
+import tempfile
+from typing import List
+
+import numpy as np
+
+from softball_models.player import Player
+from softball_models.positions import Position
+
+#
+# Enumerated lineups are stored on disk so new processes (streamlit restarts, other workers)
+# don't have to enumerate a roster again.  One .npy file per roster, least recently used
+# files are removed once the directory grows over CACHE_MAX_BYTES.
+# Set LINEUP_CACHE_DIR to an empty string to turn the cache off.
+#
+CACHE_DIR = os.environ.get("LINEUP_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "softball_lineups"))
+CACHE_MAX_BYTES = int(os.environ.get("LINEUP_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+
+# Bump whenever the stored layout or enumeration order changes so old files are never read
+_VERSION = 2
+
+def get_lineup_dtype(num_positions: int) -> np.dtype:
+    """
+    One enumerated lineup.  Player indexes are into the roster sorted by sort_roster().
+
+    bitmask: bit i is set when player i is playing
+    strength: the lineup strength
+    positions: positions[j] is the index of the player playing the j'th position
+    """
+    return np.dtype([
+        ("bitmask", np.uint64),
+        ("strength", np.float32),
+        ("positions", np.int8, (num_positions,)),
+    ])
+
+def get_player_key(player: Player):
+    """
+    The player attributes that decide which lineups they're in and how strong those lineups are.
+    """
+    strengths = sorted((pos.name, float(pos.weight), float(player.positions_stengths.get(pos, 0))) for pos in player.positions)
+    return (player.name, bool(player.female), tuple(strengths))
+
+def sort_roster(players: List[Player]) -> List[Player]:
+    """
+    Orders players by their attributes so a roster always enumerates the same way,
+    no matter what ids its players were given in this process.
+    """
+    return sorted(players, key=lambda p: (get_player_key(p), p.id))
+
+def get_roster_key(players: List[Player], positions: List[Position], min_females: int, gray_code: bool = False) -> str:
+    """
+    Cache key for the lineups of a sorted roster.
+    """
+    fingerprint = (
+        _VERSION,
+        min_females,
+        [(pos.name, float(pos.weight)) for pos in positions],
+        [get_player_key(p) for p in players],
+    )
+
+    # Gray code enumeration can pick other equally strong position assignments, so it's cached separately
+    if gray_code:
+        fingerprint += ("gray code",)
+
+    fingerprint = repr(fingerprint)
+    return hashlib.sha256(fingerprint.encode()).hexdigest()
+
+def load_lineups(key: str) -> np.ndarray | None:
+    """
+    Memory maps the cached lineups for a roster key, None if they aren't cached.
+    """
+    if not CACHE_DIR:
+        return None
+
+    path = _get_path(key)
+    try:
+        lineups = np.load(path, mmap_mode="r")
+        # Mark as recently used so it's evicted last
+        os.utime(path)
+    except (OSError, ValueError):
+        return None
+
+    return lineups
+
+def save_lineups(key: str, lineups: np.ndarray):
+    if not CACHE_DIR or not lineups.size:
+        return
+
+    path = _get_path(key)
+    tmp_path = None
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+
+        #
+        # Write then rename so other processes never read a partial file.  Streamlit sessions
+        # are threads of one process, so each save gets its own temporary file.
+        #
+        fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=CACHE_DIR)
+        with os.fdopen(fd, "wb") as f:
+            np.save(f, lineups)
+        os.replace(tmp_path, path)
+        tmp_path = None
+
+        _evict(CACHE_MAX_BYTES)
+
+    except OSError as e:
+        print("Failed to cache lineups:", e)
+
+    finally:
+        if tmp_path is not None:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+def _get_path(key: str) -> str:
+    return os.path.join(CACHE_DIR, f"{key}.npy")
+
+def _evict(max_bytes: int):
+    """
+    Removes least recently used cache files until the cache fits in max_bytes.
+    """
+    files = []
+    for entry in os.scandir(CACHE_DIR):
+        if entry.name.endswith(".npy"):
+            stat = entry.stat()
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+
+    total = sum(size for _, size, _ in files)
+
+    for _, size, path in sorted(files):
+        if total <= max_bytes:
+            break
+
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
@@ -0,0 +1,35 @@
+from typing import List
+
+import numpy as np
+
+from softball_models.player import Player
+from softball_models.positions import Position
+
+class LineupTable:
+    """
+    Every possible lineup of a roster, stored as parallel arrays indexed by lineup.
+    Lineups are sorted strongest first.  Player indexes are into players,
+    and bit i of a bitmask is set when players[i] is on the field.
+    """
+    players: List[Player]
+    positions: List[Position]
+
+    bitmask: np.ndarray           # uint64 per lineup
+    strength: np.ndarray          # float32 per lineup
+    field: np.ndarray             # (lineups, positions) index of the player at each position
+    females_playing: np.ndarray   # uint8 per lineup
+    playing_count: np.ndarray     # uint8 per lineup
+
+    def __init__(self, players: List[Player], positions: List[Position],
+                 bitmask: np.ndarray, strength: np.ndarray, field: np.ndarray,
+                 females_playing: np.ndarray, playing_count: np.ndarray):
+        self.players = players
+        self.positions = positions
+        self.bitmask = bitmask
+        self.strength = strength
+        self.field = field
+        self.females_playing = females_playing
+        self.playing_count = playing_count
+
+    def __len__(self):
+        return len(self.strength)
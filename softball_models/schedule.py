@@ -14,10 +14,24 @@ class Schedule:
 
     warnings: List[str]
 
+    # Whether the search stopped early at a deadline or when cancelled, and how much of it was done
+    partial: bool
+    fraction_explored: float
+
+    # Runners up to this schedule, best first, when the scheduler keeps them
+    alternatives: List["Schedule"]
+
+    # Hit, miss and eviction counts of the scheduler's memos, by memo
+    cache_stats: Dict[str, Dict[str, int]]
+
     def __init__(self):
         self.players = []
         self.config = None
         self.innings = []
         self.positions = []
         self.warnings = []
+        self.partial = False
+        self.fraction_explored = 1.0
+        self.alternatives = []
+        self.cache_stats = {}
 
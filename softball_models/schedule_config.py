@@ -22,7 +22,26 @@ class ScheduleConfig:
 
     schedule_type: SchedulerType = SchedulerType.GREEDY
 
+    # Processes used to enumerate lineups for the beam and dp schedulers
+    enumeration_workers: int = 1
+
+    # Enumerate lineups in Gray code order, repairing position assignments incrementally
+    enumeration_gray_code: bool = False
+
     # Beam schedule parameters
     fair_factor: int = 2
     sigma_weight: float = 2.0
-    quality_level: QualityLevel = QualityLevel.HIGH
\ No newline at end of file
+    quality_level: QualityLevel = QualityLevel.HIGH
+
+    # Processes searching the beam tree, one task per branch of the root
+    beam_workers: int = 1
+
+    # Partial schedules kept per inning by a breadth first beam search, 0 searches the percentile tree instead
+    beam_width: int = 0
+
+    # Best schedules kept by the beam search, the runners up are returned as alternatives
+    beam_schedules_kept: int = 1
+
+    # Budget for each of the beam search memos, least recently used entries are evicted past it
+    beam_cache_entries: int = 1_000_000
+    beam_cache_bytes: int = 256 * 1024 * 1024
\ No newline at end of file
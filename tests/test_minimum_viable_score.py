@@ -0,0 +1,75 @@
+import math
+import random
+from typing import List
+
+import pytest
+
+from scheduler_beam.beam_schedule import BeamScheduler
+from services import lineup_cache_service
+from services.player_service import get_default_players
+from softball_models.schedule_config import ScheduleConfig
+from utils.lru_cache import LruCache
+
+
+NUMBER_INNINGS = 7
+CASES = 5000
+
+
+@pytest.fixture(scope="module")
+def scheduler() -> BeamScheduler:
+    config = ScheduleConfig()
+    config.number_innings = NUMBER_INNINGS
+
+    # Keep the test's enumeration out of the on disk cache
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(lineup_cache_service, "CACHE_DIR", "")
+        yield BeamScheduler(get_default_players(), config, lambda *args: None)
+
+
+def scan(scheduler: BeamScheduler, strengths: List[float], current_depth: int, goal: float) -> float:
+    """
+    The half point scan _minimum_viable_score replaced.
+    """
+    lower_bound = scheduler.min_strength
+    upper_bound = scheduler.max_strength
+    remaining = scheduler.config.number_innings - current_depth
+
+    mean = sum(strengths) / len(strengths)
+    maximize_strengths = strengths + [upper_bound]*(remaining - 1)
+    minimize_stddev = strengths + [mean]*(remaining - 1)
+
+    sum_strength = sum(maximize_strengths)
+    sum_std = sum(minimize_stddev)
+    sum_std2 = sum(x*x for x in minimize_stddev)
+
+    for i in range(int(lower_bound * 2), int(upper_bound * 2) + 1):
+        v = i * 0.5
+        mean = (sum_strength + v) / (len(maximize_strengths) + 1)
+
+        n = len(minimize_stddev) + 1
+        variance = (sum_std2 + v*v)/n - ((sum_std + v)/n)**2
+        if mean - math.sqrt(variance)*scheduler.sigma_weight > goal:
+            return v
+
+    return upper_bound + 1
+
+
+@pytest.mark.parametrize("sigma_weight", [2.0, 0.5])
+def test_matches_scan(scheduler: BeamScheduler, sigma_weight: float, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(scheduler, "sigma_weight", sigma_weight)
+    monkeypatch.setattr(scheduler, "minimum_viable_score_cache", LruCache())
+
+    rng = random.Random(0)
+    tenths = scheduler.late_tenths
+
+    # Every depth the search asks at, the last inning included
+    for _ in range(CASES):
+        current_depth = rng.randint(2, NUMBER_INNINGS)
+        path = [rng.choice(tenths) for _ in range(current_depth - 1)]
+        strengths = [t / 10 for t in path]
+        goal = rng.uniform(min(strengths) - 5, max(strengths) + 5)
+
+        expected = scan(scheduler, strengths, current_depth, goal)
+        actual = scheduler._minimum_viable_score(len(path), sum(path), sum(t * t for t in path), current_depth, goal)
+
+        assert actual == expected, (strengths, current_depth, goal)
@@ -0,0 +1,69 @@
+from collections import OrderedDict
+import sys
+from typing import Any, Dict, Hashable, Optional
+
+import numpy as np
+
+
+class LruCache(OrderedDict):
+    """
+    Memo with a budget on entries and bytes, evicting the least recently used entry first.
+    Values can't be None, get returns None on a miss.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None, max_bytes: Optional[int] = None):
+        super().__init__()
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Any:
+        value = super().get(key)
+        if value is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.move_to_end(key)
+        return value
+
+    def put(self, key: Hashable, value: Any):
+        if key in self:
+            self.bytes -= self._sizeof(key, super().__getitem__(key))
+        self[key] = value
+        self.move_to_end(key)
+        self.bytes += self._sizeof(key, value)
+
+        while len(self) > 1 and self._over_budget():
+            old_key, old_value = self.popitem(last=False)
+            self.bytes -= self._sizeof(old_key, old_value)
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def _over_budget(self) -> bool:
+        if self.max_entries is not None and len(self) > self.max_entries:
+            return True
+        return self.max_bytes is not None and self.bytes > self.max_bytes
+
+    def _sizeof(self, key: Hashable, value: Any) -> int:
+        return self._deep_sizeof(key) + self._deep_sizeof(value)
+
+    def _deep_sizeof(self, value: Any) -> int:
+        # getsizeof leaves out the data of NumPy views and the items of lists and tuples
+        if isinstance(value, np.ndarray):
+            return value.nbytes
+        if isinstance(value, (list, tuple)):
+            return sys.getsizeof(value) + sum(self._deep_sizeof(item) for item in value)
+        return sys.getsizeof(value)
@@ -15,7 +15,7 @@ def get_percentile_item(lst, percentile: float):
     Returns:
         The item at the given percentile index.
     """
-    if not lst:
+    if len(lst) == 0:
         raise ValueError("List is empty")
 
     percentile = max(0.0, min(1.0, percentile))  # Clamp between 0 and 1